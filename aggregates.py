@@ -0,0 +1,186 @@
+"""Running sales totals for the admin dashboard and reports.
+
+Every committed transaction is folded into global, per-day, per-hour-of-day
+and per-item totals as it is recorded, so the admin pages read precomputed
+numbers instead of re-summing the whole transaction history on each request.
+
+Totals of several stores are combined from their aggregates (merged,
+combine_tables), in time proportional to the days and items they hold.
+"""
+import threading
+
+
+def combine_tables(tables):
+    """Sum {key: {field: number}} tables, e.g. daily sales or item sales of several stores
+
+    Fields that are not numbers (an item's nama) are taken from the first
+    table that has the key. Keys come out sorted.
+    """
+    combined = {}
+    for table in tables:
+        for key, row in table.items():
+            total = combined.get(key)
+            if total is None:
+                combined[key] = dict(row)
+                continue
+            for field, value in row.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[field] = total.get(field, 0) + value
+    return {key: combined[key] for key in sorted(combined)}
+
+
+def line_profit(line):
+    """Profit of one transaction line"""
+    if 'profit' in line:
+        return line['profit']
+    if 'harga_awal' in line:
+        return (line['harga_jual'] - line['harga_awal']) * line['quantity']
+    return 0
+
+
+class SalesAggregates:
+    """Global, per-day, per-hour and per-item sales totals plus a live top-N ranking"""
+
+    def __init__(self, top_n=10):
+        self._lock = threading.Lock()
+        self.top_n = top_n
+        self.transaction_count = 0
+        self.total_revenue = 0
+        self.total_profit = 0
+        self.total_items_sold = 0
+        self._daily = {}       # date -> {'total', 'profit', 'count'}
+        self._hourly = {}      # hour of day (0-23) -> {'total', 'profit', 'count'}
+        self._item_sales = {}  # kode -> {'nama', 'quantity', 'revenue', 'profit'}
+        self._first_seen = {}  # kode -> order of first sale, breaks ties like a stable sort
+        self._top = []         # kodes of the best sellers, best first
+
+    @classmethod
+    def merged(cls, parts, top_n=10):
+        """Aggregates holding the combined totals of `parts`, e.g. every store of a chain"""
+        merged = cls(top_n)
+        for part in parts:
+            with part._lock:
+                merged.transaction_count += part.transaction_count
+                merged.total_revenue += part.total_revenue
+                merged.total_profit += part.total_profit
+                merged.total_items_sold += part.total_items_sold
+                daily = [(date, dict(day)) for date, day in part._daily.items()]
+                item_sales = [(kode, dict(part._item_sales[kode]))
+                              for kode in sorted(part._item_sales, key=part._first_seen.get)]
+                hourly = {hour: dict(totals) for hour, totals in part._hourly.items()}
+            merged._daily = combine_tables([merged._daily, dict(daily)])
+            merged._hourly = combine_tables([merged._hourly, hourly])
+            for kode, sales in item_sales:
+                total = merged._item_sales.get(kode)
+                if total is None:
+                    merged._item_sales[kode] = sales
+                    merged._first_seen[kode] = len(merged._first_seen)
+                else:
+                    for field in ('quantity', 'revenue', 'profit'):
+                        total[field] += sales[field]
+        merged._top = sorted(merged._item_sales, key=merged._sort_key)[:top_n]
+        return merged
+
+    def record(self, transaction):
+        """Fold one transaction into the totals, in O(lines) time"""
+        date, time = transaction['timestamp'].split()
+        with self._lock:
+            self.transaction_count += 1
+            self.total_revenue += transaction['total']
+            self.total_profit += transaction['profit']
+
+            for period in (self._period(self._daily, date), self._period(self._hourly, int(time[:2]))):
+                period['total'] += transaction['total']
+                period['profit'] += transaction['profit']
+                period['count'] += 1
+
+            for line in transaction['items']:
+                self.total_items_sold += line['quantity']
+                kode = line['kode']
+                sales = self._item_sales.get(kode)
+                if sales is None:
+                    sales = self._item_sales[kode] = {'nama': line['nama'], 'quantity': 0,
+                                                      'revenue': 0, 'profit': 0}
+                    self._first_seen[kode] = len(self._first_seen)
+                sales['quantity'] += line['quantity']
+                sales['revenue'] += line['subtotal']
+                sales['profit'] += line_profit(line)
+                self._promote(kode)
+
+    def record_rollup(self, hour, kode, nama, quantity, revenue, profit, transactions):
+        """Fold in a compacted per-hour, per-item summary instead of its transactions
+
+        `hour` is the start of the hour, as 'YYYY-MM-DD HH:00:00'.
+        """
+        with self._lock:
+            self.transaction_count += transactions
+            self.total_revenue += revenue
+            self.total_profit += profit
+            self.total_items_sold += quantity
+
+            for period in (self._period(self._daily, hour[:10]),
+                           self._period(self._hourly, int(hour[11:13]))):
+                period['total'] += revenue
+                period['profit'] += profit
+                period['count'] += transactions
+
+            sales = self._item_sales.get(kode)
+            if sales is None:
+                sales = self._item_sales[kode] = {'nama': nama, 'quantity': 0, 'revenue': 0, 'profit': 0}
+                self._first_seen[kode] = len(self._first_seen)
+            sales['quantity'] += quantity
+            sales['revenue'] += revenue
+            sales['profit'] += profit
+            self._promote(kode)
+
+    def daily_sales(self):
+        """Per-day totals, oldest day first"""
+        with self._lock:
+            # Days are usually recorded in order, but a late sale can add an earlier one
+            return {date: dict(day) for date, day in sorted(self._daily.items())}
+
+    def hourly_sales(self):
+        """Per-hour-of-day totals, earliest hour first"""
+        with self._lock:
+            return {hour: dict(totals) for hour, totals in sorted(self._hourly.items())}
+
+    def item_sales(self, kode):
+        """Totals for a single item code, or None if it never sold"""
+        with self._lock:
+            sales = self._item_sales.get(kode)
+            return dict(sales) if sales else None
+
+    def top_items(self):
+        """Best selling items as (kode, totals) pairs, most units sold first"""
+        with self._lock:
+            return [(kode, dict(self._item_sales[kode])) for kode in self._top]
+
+    def summary(self):
+        """Global totals as a dict"""
+        with self._lock:
+            return {
+                'total_transactions': self.transaction_count,
+                'total_revenue': self.total_revenue,
+                'total_profit': self.total_profit,
+                'total_items_sold': self.total_items_sold
+            }
+
+    @staticmethod
+    def _period(periods, key):
+        period = periods.get(key)
+        if period is None:
+            period = periods[key] = {'total': 0, 'profit': 0, 'count': 0}
+        return period
+
+    def _sort_key(self, kode):
+        return (-self._item_sales[kode]['quantity'], self._first_seen[kode])
+
+    def _promote(self, kode):
+        # Quantities only grow, so an item can only move up the ranking and
+        # the bounded list never needs anything outside it to be re-examined.
+        if kode not in self._top:
+            if len(self._top) >= self.top_n and self._sort_key(kode) >= self._sort_key(self._top[-1]):
+                return
+            self._top.append(kode)
+        self._top.sort(key=self._sort_key)
+        del self._top[self.top_n:]
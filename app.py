@@ -1,53 +1,162 @@
 import os
+import atexit
 import logging
-from datetime import datetime
-import base64
+import threading
+from datetime import datetime, timedelta
 import io
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+import itertools
+import time
+from contextlib import ExitStack, nullcontext
+from flask import (Flask, Response, abort, current_app, g, render_template, request, redirect, url_for, flash,
+                   session, jsonify, send_file)
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Import barcode and QR code libraries
-try:
-    import qrcode
-    from qrcode.image.styledpil import StyledPilImage
-    from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
-    QRCODE_AVAILABLE = True
-except ImportError:
-    QRCODE_AVAILABLE = False
-
-try:
-    from barcode import Code128
-    from barcode.writer import ImageWriter
-    BARCODE_AVAILABLE = True
-except ImportError:
-    BARCODE_AVAILABLE = False
-
-try:
-    from PIL import Image, ImageDraw, ImageFont
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# In-memory data storage
-items_data = {}
-transactions_data = []
-next_item_id = 1
-next_transaction_id = 1
+from aggregates import SalesAggregates, combine_tables
+import assets
+import exports
+import item_import
+from code_images import (ImageCache, compose_label_sheet, image_etag, labels_per_page, render_batch,
+                         shutdown_pool)
+import metrics
+from models import Item, Line, Record, Transaction
+from profiling import ProfileStore, SamplingProfiler
+from storage import DuplicateSale, InsufficientStock, create_storage
+from stores import create_stores, parse_store_ids
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """jsonify and |tojson with items and transactions serialized as plain dicts"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+class RouteCollector:
+    """Routes and request hooks declared with the module, registered on the app by create_app
+
+    Like a blueprint whose endpoints keep their plain names, so url_for()
+    calls and templates are the same as with @app.route.
+    """
+
+    def __init__(self):
+        self._registrations = []  # functions of the app, in declaration order
+
+    def route(self, rule, endpoint=None, **options):
+        def decorator(view):
+            self._registrations.append(
+                lambda app: app.add_url_rule(rule, endpoint or view.__name__, view, **options))
+            return view
+        return decorator
+
+    def before_request(self, hook):
+        self._registrations.append(lambda app: app.before_request(hook))
+        return hook
+
+    def after_request(self, hook):
+        self._registrations.append(lambda app: app.after_request(hook))
+        return hook
+
+    def teardown_request(self, hook):
+        self._registrations.append(lambda app: app.teardown_request(hook))
+        return hook
+
+    def store_route(self, rule, endpoint=None, **options):
+        """A route of every store: `rule` for the default store and /stores/<store_id>`rule`"""
+        def decorator(view):
+            self.route('/stores/<store_id>' + rule, endpoint or view.__name__, **options)(view)
+            return self.route(rule, endpoint or view.__name__, **options)(view)
+        return decorator
+
+    def url_value_preprocessor(self, hook):
+        self._registrations.append(lambda app: app.url_value_preprocessor(hook))
+        return hook
+
+    def url_defaults(self, hook):
+        self._registrations.append(lambda app: app.url_defaults(hook))
+        return hook
+
+    def context_processor(self, hook):
+        self._registrations.append(lambda app: app.context_processor(hook))
+        return hook
+
+    def register(self, app):
+        for registration in self._registrations:
+            registration(app)
+
+routes = RouteCollector()
+
+# Storage backend that changes are written through to, picked by create_app
+storage = None
+static_assets = None  # fingerprinted, precompressed static files, loaded by create_app
+atexit.register(shutdown_pool)
+
+# Transactions older than KASIR_RETENTION_DAYS are archived to
+# KASIR_ARCHIVE_DIR and kept in memory only as rollups; disabled when unset
+ARCHIVE_ENABLED = bool(os.environ.get("KASIR_ARCHIVE_DIR"))
+RETENTION_DAYS = int(os.environ.get("KASIR_RETENTION_DAYS", 90))
+COMPACT_INTERVAL = int(os.environ.get("KASIR_COMPACT_INTERVAL", 3600))
+compaction_stop = threading.Event()
+atexit.register(compaction_stop.set)
+
+# In-memory data storage, partitioned by store (see stores.py): KASIR_STORES
+# lists the store ids, the first being the default store at the plain URLs
+STORE_IDS = parse_store_ids(os.environ.get("KASIR_STORES"))
+stores = create_stores(STORE_IDS, archive_dir=os.environ.get("KASIR_ARCHIVE_DIR"),
+                       event_queue=int(os.environ.get("KASIR_EVENT_QUEUE", 256)),
+                       recent_capacity=int(os.environ.get("KASIR_RECENT_TRANSACTIONS", 1000)))
+default_store = stores[STORE_IDS[0]]
+for _store in stores.values():
+    atexit.register(_store.event_broker.close)
+image_cache = ImageCache(int(os.environ.get("KASIR_IMAGE_CACHE_MB", 32)) * 1024 * 1024)
+SALE_KEYS_MAX = int(os.environ.get("KASIR_SALE_KEYS", 100000))
+SALE_PENDING = 0  # sale_keys value of a key whose sale is still being committed; ids start at 1
+synced_version = 0    # storage data version the dicts above reflect
+own_versions = set()  # versions written by this process that are not yet synced
+sync_lock = threading.Lock()
+
+# Metrics served at /metrics in the Prometheus text format, per worker process;
+# KASIR_METRICS_TOKEN, when set, is required as a bearer token
+metrics_registry = metrics.Registry()
+request_latency = metrics_registry.histogram(
+    'kasir_request_duration_seconds', 'Time to handle a request, by route', ('route', 'method'))
+request_count = metrics_registry.counter(
+    'kasir_requests_total', 'Requests handled, by route and status', ('route', 'method', 'status'))
+sale_count = metrics_registry.counter(
+    'kasir_sales_total', 'Sales submitted, by store, source (till, offline) and outcome',
+    ('store', 'source', 'status'))
+search_count = metrics_registry.counter(
+    'kasir_search_queries_total', 'Cashier item searches, by store and whether anything was found',
+    ('store', 'result'))
+search_latency = metrics_registry.histogram(
+    'kasir_search_duration_seconds', 'Time spent in the search index per cashier search')
+metrics_registry.collected('kasir_code_renders_total', 'Barcode and QR code images rendered',
+                           'counter', 'kind', lambda: image_cache.renders)
+metrics_registry.collected('kasir_code_render_seconds_total', 'Time spent rendering barcode and QR code images',
+                           'counter', 'kind', lambda: image_cache.render_seconds)
+catalogue_snapshot_stats = metrics.CacheStats()
+cache_metrics = metrics_registry.caches('kasir_cache')
+cache_metrics.add('code_images', image_cache)
+cache_metrics.add('catalogue_snapshot', catalogue_snapshot_stats)
+metrics_registry.gauge('kasir_code_image_cache_bytes', 'Bytes of images in the code image cache',
+                       lambda: image_cache.size)
+metrics_registry.collected('kasir_items', 'Items in the catalogue, by store', 'gauge', 'store',
+                           lambda: {store.id: len(store.items) for store in stores.values()})
+metrics_registry.collected('kasir_event_streams', 'Open /events streams, by store', 'gauge', 'store',
+                           lambda: {store.id: len(store.event_broker) for store in stores.values()})
+METRICS_TOKEN = os.environ.get("KASIR_METRICS_TOKEN")
+
+# A request with the header X-Kasir-Profile: <KASIR_PROFILE_TOKEN> is run
+# under the sampling profiler; disabled when the token is unset
+PROFILE_TOKEN = os.environ.get("KASIR_PROFILE_TOKEN")
+PROFILE_INTERVAL = int(os.environ.get("KASIR_PROFILE_INTERVAL_MS", 5)) / 1000
+profile_store = ProfileStore()
 
 # Initialize sample data for testing
-def initialize_sample_data():
+def initialize_sample_data(store):
     """Initialize some sample items for testing"""
-    global next_item_id
-    
-    if not items_data:  # Only add if no data exists
+    if not store.items:  # Only add if no data exists
         sample_items = [
             {
                 'id': 1,
@@ -82,13 +191,10 @@ def initialize_sample_data():
         ]
         
         for item in sample_items:
-            items_data[item['id']] = item
-        
-        next_item_id = 4
+            add_item(store, item)
 
         # Add sample transactions for testing
-        global next_transaction_id, transactions_data
-        if not transactions_data:  # Only add if no transactions exist
+        if not store.sales_aggregates.transaction_count:  # Only add if no sales were ever recorded
             sample_transactions = [
                 {
                     'id': 1,
@@ -136,16 +242,59 @@ def initialize_sample_data():
                 }
             ]
             
-            transactions_data.extend(sample_transactions)
-            next_transaction_id = 3
-
-# Initialize sample data when app starts
-initialize_sample_data()
+            for transaction in sample_transactions:
+                transaction = Transaction.from_dict(dict(transaction, store=store.id))
+                with storage_write():
+                    transaction['id'], _, version = storage.commit_sale(transaction, [])
+                    note_write(version)
+                record_transaction(store, transaction)
 
 # Sample admin credentials (in production, use proper authentication)
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"
 
+# Items with less stock than this are listed as low on the dashboard
+LOW_STOCK_THRESHOLD = 5
+
+# Pages only open event streams with KASIR_LIVE_EVENTS=1; each open stream
+# holds a worker thread, so that needs threaded gunicorn workers (gthread)
+LIVE_EVENTS = os.environ.get("KASIR_LIVE_EVENTS") == "1"
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE = 15
+EVENT_TOPICS = {'stock', 'transaction', 'low_stock'}
+
+# Items rendered into the POS page; the rest are found by searching
+POS_GRID_ITEMS = 60
+
+# Cashier search result limits
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+# Transactions per page in the admin report
+REPORT_PAGE_SIZE = 10
+
+# Transactions per page in the cashier history
+HISTORY_PAGE_SIZE = 50
+
+# How long browsers and proxies may reuse a barcode or QR code image (seconds)
+IMAGE_MAX_AGE = 7 * 24 * 3600
+
+# Upper bound on labels in one sheet request
+LABEL_SHEET_MAX = int(os.environ.get("KASIR_LABEL_SHEET_MAX", 2000))
+LABEL_FORMATS = {'pdf': 'application/pdf', 'png': 'image/png', 'zip': 'application/zip'}
+
+# Row errors returned by one catalogue import (the count covers all of them)
+IMPORT_MAX_ERRORS = 1000
+
+# Offline sale batches: sales per request and idempotency key length
+SALE_BATCH_MAX = 500
+SALE_KEY_MAX_LENGTH = 64
+
+# Dynamic responses of these types are compressed from this many bytes on
+COMPRESS_MIN_BYTES = int(os.environ.get("KASIR_COMPRESS_MIN_BYTES", 1024))
+COMPRESS_MIMETYPES = {'text/html', 'application/json', 'text/plain'}
+
 def calculate_profit(harga_awal, harga_jual, quantity=1):
     """Calculate profit from selling items"""
     return (harga_jual - harga_awal) * quantity
@@ -155,12 +304,619 @@ def calculate_total_profit(harga_awal, harga_jual, stok_awal, stok_akhir):
     items_sold = stok_awal - stok_akhir
     return (harga_jual - harga_awal) * items_sold
 
-def get_item_by_code(kode):
+def get_item_by_code(store, kode):
     """Get item by its code"""
-    for item in items_data.values():
-        if item['kode'] == kode:
-            return item
-    return None
+    return store.items_by_code.get(kode)
+
+def record_store(record):
+    """The store a stored item or transaction belongs to, None for a store not served here"""
+    # Records written before stores existed belong to the default store
+    return stores.get(record.get('store') or default_store.id)
+
+def index_item(store, item):
+    """Add an item to a store's in-memory catalogue and its indexes"""
+    item = Item.from_dict(item)
+    item['store'] = store.id
+    update_item_profit(item)
+    store.items[item['id']] = item
+    store.items_by_code[item['kode']] = item
+    store.search_index.add(item)
+    item_changed(store, item)
+    return item
+
+def reindex_item(store, item, old_kode):
+    """Refresh the indexes after an item's fields changed in place"""
+    if item['kode'] != old_kode:
+        if store.items_by_code.get(old_kode) is item:
+            del store.items_by_code[old_kode]
+        store.items_by_code[item['kode']] = item
+        image_cache.invalidate(old_kode)
+    store.search_index.update(item)
+    item_changed(store, item)
+
+def unindex_item(store, item_id):
+    """Drop an item from a store's in-memory catalogue and its indexes"""
+    item = store.items.pop(item_id, None)
+    if item is not None:
+        if store.items_by_code.get(item['kode']) is item:
+            del store.items_by_code[item['kode']]
+        store.search_index.remove(item_id)
+        image_cache.invalidate(item['kode'])
+        item_changed(store, item, deleted=True)
+    return item
+
+def item_changed(store, item, deleted=False):
+    """Version an item change for catalogue sync and publish stock moves to live screens"""
+    store.catalogue_log.touch(item['id'], deleted)
+    old_stock = store.published_stock.pop(item['id'], None)
+    new_stock = None if deleted else item['stok_akhir']
+    if new_stock is not None:
+        store.published_stock[item['id']] = new_stock
+    if new_stock == old_stock:
+        return
+    fields = {'id': item['id'], 'kode': item['kode'], 'nama': item['nama']}
+    store.event_broker.publish('stock', dict(fields, stok_akhir=new_stock, deleted=deleted))
+    # Crossing the dashboard's low-stock line, in either direction
+    was_low = old_stock is not None and old_stock < LOW_STOCK_THRESHOLD
+    is_low = new_stock is not None and new_stock < LOW_STOCK_THRESHOLD
+    if was_low != is_low and not deleted:
+        store.event_broker.publish('low_stock', dict(fields, stok_akhir=new_stock, low=is_low))
+
+def add_item(store, item):
+    """Persist a new item of a store, assigning its id, and index it"""
+    item = Item.from_dict(item)
+    item['store'] = store.id
+    with storage_write():
+        item['id'], version = storage.insert_item(item)
+        note_write(version)
+        index_item(store, item)
+    return item
+
+def update_item(store, item, **changes):
+    """Persist field changes to an item, then apply them and re-index it"""
+    with store.item_locks.hold([item['id']]), storage_write():
+        note_write(storage.save_item(dict(item, **changes)))
+        old_kode = item['kode']
+        item.update(changes)
+        update_item_profit(item)
+        reindex_item(store, item, old_kode)
+    return item
+
+def remove_item(store, item_id):
+    """Delete an item from storage and the store's in-memory catalogue"""
+    with store.item_locks.hold([item_id]):
+        if item_id not in store.items:
+            return None
+        with storage_write():
+            note_write(storage.delete_item(item_id))
+            item = unindex_item(store, item_id)
+    store.item_locks.discard(item_id)
+    return item
+
+def import_items(store, rows, dry_run=False):
+    """Validate catalogue import rows in one pass, then apply the valid ones as one batch
+
+    `rows` yields (row number, raw row) as item_import.read_rows() does.
+    Returns (inserted, updated, errors) where errors lists the rows left out
+    with their reason; with dry_run nothing is written.
+    """
+    errors = []
+    new_items = {}  # kode -> (row number, new item)
+    updates = {}    # item id -> (row number, kode, fields, stock delta)
+    seen = set()
+    for number, row in rows:
+        try:
+            kode, fields, stock = item_import.parse_row(row)
+            if kode in seen:
+                raise item_import.InvalidRow('Kode barang muncul lebih dari sekali dalam berkas')
+            seen.add(kode)
+            item = store.items_by_code.get(kode)
+            if item is None:
+                missing = [name for name in item_import.REQUIRED_FOR_NEW if name not in fields]
+                if missing:
+                    raise item_import.InvalidRow(f'Barang baru wajib mengisi {", ".join(missing)}')
+                if stock < 0:
+                    raise item_import.InvalidRow('Stok barang baru tidak boleh negatif')
+                new_items[kode] = (number, Item.from_dict(dict(
+                    fields, id=None, kode=kode, stok_awal=stock, stok_akhir=stock, profit=0,
+                    store=store.id)))
+            elif item['stok_akhir'] + stock < 0:
+                raise item_import.InvalidRow(f'Stok {item["nama"]} tidak mencukupi untuk dikurangi')
+            else:
+                updates[item['id']] = (number, kode, fields, stock)
+        except item_import.InvalidRow as e:
+            errors.append({'row': number, 'kode': row.get('kode') if row else None, 'message': str(e)})
+    if dry_run:
+        return len(new_items), len(updates), errors
+    
+    def refuse(number, kode, message):
+        errors.append({'row': number, 'kode': kode, 'message': message})
+    
+    # Lock every updated item for the batch; items may have been deleted,
+    # sold out or added by someone else since the rows were checked
+    with store.item_locks.hold(updates), storage_write():
+        batch = []
+        for item_id, (number, kode, fields, stock) in updates.items():
+            item = store.items.get(item_id)
+            if item is None:
+                refuse(number, kode, 'Barang sudah dihapus')
+            elif item['stok_akhir'] + stock < 0:
+                refuse(number, kode, f'Stok {item["nama"]} tidak mencukupi untuk dikurangi')
+            else:
+                batch.append((item_id, fields, stock))
+        inserts = []
+        for kode, (number, item) in new_items.items():
+            if kode in store.items_by_code:
+                refuse(number, kode, 'Kode barang sudah ada')
+            else:
+                inserts.append(item)
+        
+        item_ids, stock_levels, version = storage.import_items(inserts, batch)
+        note_write(version)
+        
+        for item, item_id in zip(inserts, item_ids):
+            item['id'] = item_id
+            index_item(store, item)
+        updated = 0
+        for item_id, fields, stock in batch:
+            item = store.items[item_id]
+            if stock_levels is not None and item_id not in stock_levels:
+                number, kode = updates[item_id][:2]
+                refuse(number, kode, f'Stok {item["nama"]} tidak mencukupi untuk dikurangi')
+                continue
+            item.update(fields)
+            if stock_levels is None:
+                item['stok_awal'] += stock
+                item['stok_akhir'] += stock
+            else:
+                item['stok_awal'], item['stok_akhir'] = stock_levels[item_id]
+            update_item_profit(item)
+            reindex_item(store, item, item['kode'])
+            updated += 1
+    errors.sort(key=lambda error: error['row'])
+    return len(inserts), updated, errors
+
+def record_transaction(store, transaction):
+    """Append a committed transaction to a store and fold it into its sales aggregates"""
+    transaction = Transaction.from_dict(transaction)
+    transaction['store'] = store.id
+    if transaction['key']:
+        remember_sale_key(store, transaction['key'], transaction['id'])
+    store.transactions.append(transaction)
+    store.sales_aggregates.record(transaction)
+    store.sales_ledger.record(transaction)
+    store.recent_transactions.record(transaction)
+    store.event_broker.publish('transaction', {
+        'id': transaction['id'],
+        'timestamp': transaction['timestamp'],
+        'total': transaction['total'],
+        'profit': transaction['profit'],
+        'item_count': sum(line['quantity'] for line in transaction['items'])
+    })
+    return transaction
+
+def remember_sale_key(store, key, transaction_id):
+    """Note the transaction an idempotency key was sold as, keeping the newest keys only"""
+    with store.sale_keys_lock:
+        store.sale_keys[key] = transaction_id
+        excess = len(store.sale_keys) - SALE_KEYS_MAX
+        if excess > 0:
+            # Keys still being sold are kept, or their sale could be committed twice
+            oldest = itertools.islice((sold_key for sold_key, sold in store.sale_keys.items()
+                                       if sold != SALE_PENDING), excess)
+            for sold_key in list(oldest):
+                del store.sale_keys[sold_key]
+
+def reserve_sale_key(store, key, stored=None):
+    """Reserve an idempotency key before its sale is committed
+
+    Returns None when the key is now reserved for the caller; otherwise the
+    transaction id it was sold as, or SALE_PENDING while another request is
+    still committing it. `stored` is {key: transaction id} of keys already
+    looked up in storage; without it the key is looked up here.
+    """
+    with store.sale_keys_lock:
+        taken = store.sale_keys.get(key)
+        if taken is None:
+            store.sale_keys[key] = SALE_PENDING
+    if taken is not None:
+        return taken
+    # Keys committed by other worker processes are only known to the database
+    try:
+        transaction_id = (storage.find_sales([key]) if stored is None else stored).get(key)
+    except BaseException:
+        # A failed lookup must not leave the key pending, or every retry would be refused
+        release_sale_key(store, key)
+        raise
+    if transaction_id is not None:
+        remember_sale_key(store, key, transaction_id)
+    return transaction_id
+
+def release_sale_key(store, key):
+    """Drop the reservation of a key whose sale was not committed"""
+    with store.sale_keys_lock:
+        if store.sale_keys.get(key) == SALE_PENDING:
+            del store.sale_keys[key]
+
+class SaleError(Exception):
+    """A basket that cannot be sold; the message is shown to the cashier"""
+
+def resolve_basket(store, cart_items):
+    """The store's inventory item and quantity of every cart line; raises SaleError"""
+    lines = []
+    for cart_item in cart_items:
+        kode = cart_item.get('kode')
+        quantity = cart_item.get('quantity')
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise SaleError(f'Jumlah barang {kode} tidak valid!')
+        
+        # Find item in inventory
+        item = get_item_by_code(store, kode)
+        if not item:
+            raise SaleError(f'Barang {kode} tidak ditemukan!')
+        lines.append((item, quantity))
+    return lines
+
+def build_sale(store, lines, payment_amount, reserved, timestamp=None):
+    """The transaction and stock changes for a resolved basket, with its items locked
+
+    Stock is checked net of `reserved` (item id -> units taken by earlier
+    baskets of the same commit), which is only added to when the basket is
+    valid; raises SaleError otherwise.
+    """
+    transaction_items = []
+    stock_changes = []
+    taken = {}  # item id -> units taken by earlier lines of this basket
+    total_amount = 0
+    total_profit = 0
+    
+    for item, quantity in lines:
+        # The item may have been deleted while we waited for its lock
+        if store.items.get(item['id']) is not item:
+            raise SaleError(f'Barang {item["kode"]} tidak ditemukan!')
+        
+        # Check stock
+        units = reserved.get(item['id'], 0) + taken.get(item['id'], 0)
+        if item['stok_akhir'] - units < quantity:
+            raise SaleError(f'Stok {item["nama"]} tidak mencukupi!')
+        taken[item['id']] = taken.get(item['id'], 0) + quantity
+        
+        # Calculate subtotal and profit
+        subtotal = item['harga_jual'] * quantity
+        profit = calculate_profit(item['harga_awal'], item['harga_jual'], quantity)
+        
+        # Add to transaction items
+        transaction_items.append(Line(item, quantity, subtotal, profit))
+        stock_changes.append((item['id'], quantity))
+        
+        total_amount += subtotal
+        total_profit += profit
+    
+    for item_id, quantity in taken.items():
+        reserved[item_id] = reserved.get(item_id, 0) + quantity
+    
+    # Calculate change
+    change = payment_amount - total_amount if payment_amount >= total_amount else 0
+    
+    # Create transaction record (the id is assigned by the storage backend)
+    transaction = Transaction.from_dict({
+        'id': None,
+        'timestamp': timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'items': transaction_items,
+        'total': total_amount,
+        'profit': total_profit,
+        'payment_amount': payment_amount,
+        'change': change,
+        'store': store.id
+    })
+    return transaction, stock_changes
+
+def apply_stock(store, stock_changes, stock_levels):
+    """Bring the in-memory stock in line with a committed sale; nothing here can fail"""
+    for item_id, quantity in stock_changes:
+        item = store.items[item_id]
+        if stock_levels is None:
+            item['stok_akhir'] -= quantity
+        else:
+            item['stok_akhir'] = stock_levels[item_id]
+        update_item_profit(item)
+        store.search_index.update_stock(item)
+        item_changed(store, item)
+
+def checkout(store, cart_items, payment_amount, key=None):
+    """Sell a basket from a store atomically: every line is committed or none is
+
+    `key` is the till's optional idempotency key for the sale. A key that
+    was already sold, or is being sold by another request, raises
+    DuplicateSale with its transaction id (SALE_PENDING while in flight).
+    """
+    # A resent sale must not be sold again, even while the first is being committed
+    if key:
+        taken = reserve_sale_key(store, key)
+        if taken is not None:
+            raise DuplicateSale(taken)
+    
+    try:
+        # Resolve every line to an inventory item before taking any locks
+        lines = resolve_basket(store, cart_items)
+        
+        # Lock only the items in this basket (in id order, so baskets sharing
+        # items cannot deadlock), then validate, commit and apply as one step
+        with store.item_locks.hold(item['id'] for item, _ in lines):
+            transaction, stock_changes = build_sale(store, lines, payment_amount, {})
+            transaction['key'] = key
+            
+            # Write the sale through; a database backend re-checks stock across
+            # worker processes and rolls the whole sale back if any line fails
+            with storage_write():
+                try:
+                    transaction['id'], stock_levels, version = storage.commit_sale(transaction,
+                                                                                   stock_changes)
+                except InsufficientStock as e:
+                    item = store.items.get(e.item_id)
+                    raise SaleError(f'Stok {item["nama"] if item else e.item_id} tidak mencukupi!')
+                note_write(version)
+                
+                # Update stock and item profit
+                apply_stock(store, stock_changes, stock_levels)
+    except DuplicateSale as e:
+        # Another worker process committed the same key first
+        remember_sale_key(store, key, e.transaction_id)
+        raise
+    except BaseException:
+        if key:
+            release_sale_key(store, key)
+        raise
+    
+    record_transaction(store, transaction)
+    return transaction
+
+def offline_timestamp(store, value):
+    """The till's own time for an offline sale, or now when it sent none"""
+    now = datetime.now()
+    if value is None:
+        return now.strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        moment = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        raise SaleError('Waktu transaksi tidak valid!')
+    cutoff = store.archive.cutoff if store.archive is not None else None
+    if cutoff is not None and moment < cutoff:
+        raise SaleError('Transaksi sudah melewati masa simpan!')
+    # A till clock running ahead must not put sales in the future
+    return min(moment, now).strftime('%Y-%m-%d %H:%M:%S')
+
+def checkout_batch(store, sales):
+    """Sell a queue of baskets a store's till recorded offline, under one lock and one storage commit
+
+    Every sale carries a client-generated idempotency key; a key that was
+    already committed is answered with its transaction instead of selling
+    again, so a till can resend a batch safely. Returns one result per sale,
+    in order, with status 'created', 'duplicate', 'pending' (another request
+    is committing the key right now; send it again later) or 'rejected'.
+    """
+    results = [None] * len(sales)
+    
+    def rejected(position, key, message):
+        results[position] = {'key': key, 'status': 'rejected', 'message': message}
+    
+    def duplicate(position, key, transaction_id):
+        if transaction_id == SALE_PENDING:
+            results[position] = {'key': key, 'status': 'pending',
+                                 'message': 'Transaksi sedang diproses, kirim ulang nanti'}
+        else:
+            results[position] = {'key': key, 'status': 'duplicate', 'transaction_id': transaction_id}
+    
+    # Keys reserved by the batch are released when it ends, unless sold by then
+    with store.sale_batch_lock, ExitStack() as reservations:
+        # Keys committed by other worker processes are only known to the database
+        stored = storage.find_sales({sale['key'] for sale in sales if isinstance(sale, dict)
+                                     and isinstance(sale.get('key'), str)
+                                     and sale['key'] not in store.sale_keys})
+        
+        # Resolve and check every sale before taking any item locks
+        resolved = []
+        keys = set()
+        for position, sale in enumerate(sales):
+            key = sale.get('key') if isinstance(sale, dict) else None
+            try:
+                if not isinstance(key, str) or not key or len(key) > SALE_KEY_MAX_LENGTH:
+                    raise SaleError('Kunci transaksi tidak valid!')
+                if key in keys:
+                    raise SaleError('Kunci transaksi muncul lebih dari sekali!')
+                keys.add(key)
+                taken = reserve_sale_key(store, key, stored)
+                if taken is not None:
+                    duplicate(position, key, taken)
+                    continue
+                reservations.callback(release_sale_key, store, key)
+                payment_amount = sale.get('payment_amount', 0)
+                if not isinstance(payment_amount, (int, float)) or isinstance(payment_amount, bool):
+                    raise SaleError('Jumlah pembayaran tidak valid!')
+                if not sale.get('items'):
+                    raise SaleError('Keranjang kosong!')
+                timestamp = offline_timestamp(store, sale.get('timestamp'))
+                resolved.append((position, key, resolve_basket(store, sale['items']), payment_amount,
+                                 timestamp))
+            except SaleError as e:
+                rejected(position, key, str(e))
+        
+        # One lock cycle over every item in the batch; sales are checked in
+        # order, each against the stock left by the ones before it
+        committed = []
+        with store.item_locks.hold(item['id'] for _, _, lines, _, _ in resolved for item, _ in lines):
+            reserved = {}
+            pending = []
+            for position, key, lines, payment_amount, timestamp in resolved:
+                try:
+                    transaction, stock_changes = build_sale(store, lines, payment_amount, reserved,
+                                                            timestamp)
+                except SaleError as e:
+                    rejected(position, key, str(e))
+                    continue
+                transaction['key'] = key
+                pending.append((position, transaction, stock_changes))
+            
+            with storage_write():
+                outcomes, stock_levels, version = storage.commit_sales(
+                    [(transaction, stock_changes) for _, transaction, stock_changes in pending])
+                note_write(version)
+                
+                for (position, transaction, stock_changes), outcome in zip(pending, outcomes):
+                    key = transaction['key']
+                    if isinstance(outcome, DuplicateSale):
+                        remember_sale_key(store, key, outcome.transaction_id)
+                        duplicate(position, key, outcome.transaction_id)
+                    elif isinstance(outcome, InsufficientStock):
+                        item = store.items.get(outcome.item_id)
+                        nama = item['nama'] if item else outcome.item_id
+                        rejected(position, key, f'Stok {nama} tidak mencukupi!')
+                    else:
+                        transaction['id'] = outcome
+                        apply_stock(store, stock_changes, stock_levels)
+                        committed.append(transaction)
+                        results[position] = {
+                            'key': key,
+                            'status': 'created',
+                            'transaction_id': transaction['id'],
+                            'total': transaction['total'],
+                            'change': transaction['change'],
+                            'timestamp': transaction['timestamp']
+                        }
+        
+        for transaction in committed:
+            record_transaction(store, transaction)
+    return results
+
+def storage_write():
+    """The lock a storage write, its note_write() and its in-memory changes are made under
+
+    With a storage shared between worker processes this is sync_lock, so a
+    sync never reads a write of this process before it is noted as its own
+    and is never interleaved with applying it. Other backends never sync,
+    and their writes stay concurrent for the journal's group commit.
+    """
+    return sync_lock if storage.shared else nullcontext()
+
+def note_write(version):
+    """Remember a data version written by this process so syncing skips it; call under storage_write()"""
+    global synced_version
+    if version is None:
+        return
+    own_versions.add(version)
+    while synced_version + 1 in own_versions:
+        synced_version += 1
+        own_versions.discard(synced_version)
+
+def load_from_storage():
+    """Fill every store's in-memory dicts and indexes from the storage backend"""
+    global synced_version
+    cutoffs = []
+    for store in stores.values():
+        if store.archive is None:
+            continue
+        # Archived history enters the totals as rollups, not transactions
+        for hour, kode, nama, quantity, revenue, profit, count in store.archive.rows():
+            store.sales_aggregates.record_rollup(hour, kode, nama, quantity, revenue, profit, count)
+            store.sales_ledger.record_rollup(kode, nama, datetime.fromisoformat(hour), quantity, revenue,
+                                             profit, count)
+        cutoffs.append(store.archive.cutoff)
+    # Stores archive separately, so read from the earliest cutoff and skip
+    # what a store has archived already
+    since = min(cutoffs) if cutoffs and None not in cutoffs else None
+    version, items, transactions = storage.load(since)
+    ignored = 0
+    for item in items:
+        store = record_store(item)
+        if store is None:
+            ignored += 1
+        else:
+            index_item(store, item)
+    for transaction in transactions:
+        store = record_store(transaction)
+        if store is None:
+            ignored += 1
+        elif not before_cutoff(store, transaction):
+            record_transaction(store, transaction)
+    if ignored:
+        current_app.logger.warning('Ignored %d items and transactions of stores not in KASIR_STORES', ignored)
+    synced_version = version
+
+def before_cutoff(store, transaction):
+    """Whether a transaction is before its store's archive cutoff, so only in the rollups"""
+    cutoff = store.archive.cutoff if store.archive is not None else None
+    return cutoff is not None and transaction['timestamp'] < cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+def compact_transactions(now=None):
+    """Archive every store's transactions older than the retention period and keep only their rollups"""
+    cutoff = datetime.combine((now or datetime.now()).date() - timedelta(days=RETENTION_DAYS),
+                              datetime.min.time())
+    count = 0
+    for store in stores.values():
+        old = store.transactions.remove_before(cutoff)
+        if old:
+            try:
+                store.archive.archive(old, cutoff)
+            except Exception:
+                for transaction in old:
+                    store.transactions.append(transaction)
+                raise
+        # The totals already include them; only the detail is dropped
+        store.sales_ledger.compact_before(cutoff)
+        count += len(old)
+    # Storage drops them only once every store has archived its share
+    storage.forget_before(cutoff)
+    return count
+
+def compaction_loop(app):
+    """Compact at startup and then every COMPACT_INTERVAL seconds"""
+    while True:
+        try:
+            compact_transactions()
+        except Exception:
+            app.logger.exception('Transaction compaction failed')
+        if compaction_stop.wait(COMPACT_INTERVAL):
+            return
+
+def paginate_newest_first(records, page, per_page):
+    """Slice one page out of a chronological list, newest records first"""
+    total = len(records)
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), pages)
+    end = total - (page - 1) * per_page
+    start = max(end - per_page, 0)
+    pagination = {
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'total': total,
+        'has_prev': page > 1,
+        'has_next': page < pages
+    }
+    return records[start:end][::-1], pagination
+
+def request_period():
+    """The from/to query parameters (YYYY-MM-DD, inclusive) as a half-open datetime range
+
+    Returns (start, end) where either may be None; raises ValueError for a
+    malformed date.
+    """
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    start = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+    end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1) if date_to else None
+    return start, end
+
+def report_figures(summary, daily_sales):
+    """Add margin, averages and the covered period to a report summary, in place"""
+    count = summary['total_transactions']
+    summary['profit_margin'] = (summary['total_profit'] / summary['total_revenue'] * 100) if summary['total_revenue'] > 0 else 0
+    summary['average_transaction'] = summary['total_revenue'] / count if count > 0 else 0
+    summary['average_profit'] = summary['total_profit'] / count if count > 0 else 0
+    dates = list(daily_sales)
+    summary['period_start'] = dates[0] if dates else None
+    summary['period_end'] = dates[-1] if dates else None
+    return summary
 
 def update_item_profit(item):
     """Update profit for a single item based on sales"""
@@ -168,12 +924,161 @@ def update_item_profit(item):
                                           item['stok_awal'], item['stok_akhir'])
     return item
 
-@app.route('/')
+@routes.before_request
+def start_request_metrics():
+    """Time the request, and profile it when the profiling header asks for it"""
+    g.request_started = time.perf_counter()
+    if PROFILE_TOKEN and request.headers.get('X-Kasir-Profile') == PROFILE_TOKEN:
+        g.profiler = SamplingProfiler(interval=PROFILE_INTERVAL).start()
+
+@routes.after_request
+def finish_request_metrics(response):
+    """Record the request's latency and status, and keep its profile"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe(time.perf_counter() - started, route=route, method=request.method)
+        request_count.inc(route=route, method=request.method, status=response.status_code)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        response.headers['X-Kasir-Profile-Id'] = profile_store.add(
+            f'{request.method} {request.full_path} -> {response.status_code}', profiler)
+        response.headers['Server-Timing'] = f'app;dur={profiler.duration * 1000:.1f}'
+    return response
+
+@routes.teardown_request
+def stop_request_profiler(exc):
+    """Stop a profiler that finish_request_metrics never reached"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+@routes.after_request
+def compress_response(response):
+    """Compress a large HTML, JSON or text body for a client that accepts it"""
+    # Streams (exports, events) and files are left alone, as are bodies compressed already
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESS_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = assets.choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding == 'identity' or len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(assets.compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The ETag still names the uncompressed body, so it is no longer byte-exact
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@routes.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Make url_for('static', filename=...) link to the file's fingerprinted name"""
+    if endpoint == 'static' and 'filename' in values:
+        if current_app.debug:
+            # Pick up edits without a restart while developing
+            static_assets.refresh()
+        values['filename'] = static_assets.url_name(values['filename'])
+
+@routes.url_value_preprocessor
+def select_store(endpoint, values):
+    """Take the store of a /stores/<store_id>/... URL out of the view arguments into g.store"""
+    store_id = values.pop('store_id', None) if values else None
+    if store_id is None:
+        g.store = default_store
+    elif store_id in stores:
+        g.store = stores[store_id]
+    else:
+        abort(404)
+
+@routes.url_defaults
+def store_urls(endpoint, values):
+    """Keep url_for() links to store pages within the store being viewed"""
+    store = g.get('store')
+    if (store is not None and store is not default_store and 'store_id' not in values
+            and current_app.url_map.is_endpoint_expecting(endpoint, 'store_id')):
+        values['store_id'] = store.id
+
+@routes.context_processor
+def store_context():
+    """The store being viewed and every store, for the navigation, and whether pages stream events"""
+    return {'store': g.get('store', default_store), 'stores': stores, 'live_events': LIVE_EVENTS}
+
+@routes.route('/static/<path:filename>', endpoint='static')
+def static_file(filename):
+    """A static file from memory, in the best precompressed encoding the client accepts
+
+    Fingerprinted names never change content and are cached for a year;
+    plain names are revalidated with the ETag.
+    """
+    asset = static_assets.get(filename)
+    if asset is None:
+        abort(404)
+    
+    encoding = assets.choose_encoding(request.accept_encodings, asset.encodings)
+    if request.if_none_match.contains_weak(asset.etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(asset.encodings[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    # One weak ETag for every encoding of the same content
+    response.set_etag(asset.etag, weak=True)
+    if len(asset.encodings) > 1:
+        response.vary.add('Accept-Encoding')
+    if filename != asset.name:
+        response.cache_control.public = True
+        response.cache_control.max_age = assets.IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+@routes.before_request
+def sync_from_storage():
+    """Pull in items and sales that other worker processes wrote"""
+    global synced_version
+    if storage.version() == synced_version:
+        return
+    with sync_lock:
+        version, items, transactions = storage.changes_since(synced_version)
+        for item_id, fields in items:
+            if fields is None:
+                # Deleted rows carry no store; ids are unique across the chain
+                for store in stores.values():
+                    unindex_item(store, item_id)
+                continue
+            store = record_store(fields)
+            if store is None:
+                continue
+            item = store.items.get(item_id)
+            if item is None:
+                index_item(store, fields)
+            else:
+                # No item lock: checkout takes sync_lock while holding its item
+                # locks. Local writes change items under sync_lock too, so they
+                # and this update are applied in storage order
+                old_kode = item['kode']
+                item.update(fields, store=store.id)
+                update_item_profit(item)
+                reindex_item(store, item, old_kode)
+        for transaction_version, transaction in transactions:
+            store = record_store(transaction)
+            if transaction_version not in own_versions and store is not None:
+                record_transaction(store, transaction)
+        # Own versions above what was read are still to be skipped by the next sync
+        own_versions.difference_update([noted for noted in own_versions if noted <= version])
+        synced_version = max(synced_version, version)
+
+@routes.route('/')
 def index():
     """Home page with role selection"""
     return render_template('index.html')
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@routes.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     """Admin login"""
     if request.method == 'POST':
@@ -190,7 +1095,7 @@ def admin_login():
     
     return render_template('admin/login.html')
 
-@app.route('/admin/logout')
+@routes.route('/admin/logout')
 def admin_logout():
     """Admin logout"""
     session.pop('user_role', None)
@@ -198,151 +1103,146 @@ def admin_logout():
     flash('Logout berhasil!', 'success')
     return redirect(url_for('index'))
 
-@app.route('/admin/dashboard')
+@routes.store_route('/admin/dashboard')
 def admin_dashboard():
     """Admin dashboard"""
     if session.get('user_role') != 'admin':
         flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
         return redirect(url_for('admin_login'))
     
-    # Calculate statistics
-    total_items = len(items_data)
-    total_transactions = len(transactions_data)
-    total_revenue = sum(t['total'] for t in transactions_data)
-    total_profit = sum(t['profit'] for t in transactions_data)
+    # Statistics come from the store's running sales totals; item profit is
+    # kept current by update_item_profit whenever stock or prices change
+    store = g.store
+    totals = store.sales_aggregates.summary()
     
-    # Update profit for each item based on sales
-    for item in items_data.values():
-        item['profit'] = calculate_total_profit(item['harga_awal'], item['harga_jual'], 
-                                              item['stok_awal'], item['stok_akhir'])
-    
-    # Low stock items (less than 5)
-    low_stock_items = [item for item in items_data.values() if item['stok_akhir'] < 5]
+    # Low stock items (less than LOW_STOCK_THRESHOLD)
+    low_stock_items = [item for item in store.items.values() if item['stok_akhir'] < LOW_STOCK_THRESHOLD]
     
     stats = {
-        'total_items': total_items,
-        'total_transactions': total_transactions,
-        'total_revenue': total_revenue,
-        'total_profit': total_profit,
+        'total_items': len(store.items),
+        'total_transactions': totals['total_transactions'],
+        'total_revenue': totals['total_revenue'],
+        'total_profit': totals['total_profit'],
         'low_stock_count': len(low_stock_items)
     }
     
     return render_template('admin/dashboard.html', stats=stats, low_stock_items=low_stock_items)
 
-@app.route('/admin/items')
+@routes.store_route('/admin/items')
 def admin_items():
     """View all items"""
     if session.get('user_role') != 'admin':
         flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
         return redirect(url_for('admin_login'))
     
-    return render_template('admin/items.html', items=items_data.values())
+    return render_template('admin/items.html', items=g.store.items.values())
+
+def code_image_response(code, kind, as_attachment=False):
+    """Serve a cached barcode or QR code PNG with validators for browser caching"""
+    label = 'barcode' if kind == 'barcode' else 'QR code'
+    etag = image_etag(code, kind)
+    
+    # Rendering is deterministic, so a matching ETag needs no work at all
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        try:
+            png = image_cache.get(code, kind)
+        except ImportError as e:
+            current_app.logger.error(f"{label[0].upper() + label[1:]} library import error: {e}")
+            return f"{label[0].upper() + label[1:]} library not available", 404
+        except Exception as e:
+            current_app.logger.error(f"Error generating {label}: {e}")
+            return f"Error generating {label}: {str(e)}", 500
+        response = send_file(io.BytesIO(png), mimetype='image/png', as_attachment=as_attachment,
+                             download_name=f'{kind}_{code}.png', conditional=False,
+                             max_age=IMAGE_MAX_AGE)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    return response
 
-@app.route('/generate_barcode/<code>')
+@routes.route('/generate_barcode/<code>')
 def generate_barcode(code):
     """Generate barcode image"""
-    try:
-        # Force re-import to ensure libraries are available
-        from barcode import Code128
-        from barcode.writer import ImageWriter
-        
-        # Generate barcode
-        code128 = Code128(code, writer=ImageWriter())
-        buffer = io.BytesIO()
-        code128.write(buffer)
-        buffer.seek(0)
-        
-        return send_file(buffer, mimetype='image/png', as_attachment=False)
-    except ImportError as e:
-        app.logger.error(f"Barcode library import error: {e}")
-        # Return a simple error image instead of JSON
-        return "Barcode library not available", 404
-    except Exception as e:
-        app.logger.error(f"Error generating barcode: {e}")
-        return f"Error generating barcode: {str(e)}", 500
+    return code_image_response(code, 'barcode')
 
-@app.route('/generate_qrcode/<code>')
+@routes.route('/generate_qrcode/<code>')
 def generate_qrcode(code):
     """Generate QR code image"""
-    try:
-        # Force re-import to ensure libraries are available
-        import qrcode
-        
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(code)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return send_file(buffer, mimetype='image/png', as_attachment=False)
-    except ImportError as e:
-        app.logger.error(f"QR code library import error: {e}")
-        # Return a simple error message instead of JSON
-        return "QR code library not available", 404
-    except Exception as e:
-        app.logger.error(f"Error generating QR code: {e}")
-        return f"Error generating QR code: {str(e)}", 500
+    return code_image_response(code, 'qrcode')
 
-@app.route('/download_barcode/<code>')
+@routes.route('/download_barcode/<code>')
 def download_barcode(code):
     """Download barcode as file"""
-    try:
-        from barcode import Code128
-        from barcode.writer import ImageWriter
-        
-        code128 = Code128(code, writer=ImageWriter())
-        buffer = io.BytesIO()
-        code128.write(buffer)
-        buffer.seek(0)
-        
-        return send_file(buffer, mimetype='image/png', as_attachment=True, 
-                        download_name=f'barcode_{code}.png')
-    except ImportError as e:
-        app.logger.error(f"Barcode library import error: {e}")
-        return "Barcode library not available", 404
-    except Exception as e:
-        app.logger.error(f"Error downloading barcode: {e}")
-        return f"Error downloading barcode: {str(e)}", 500
+    return code_image_response(code, 'barcode', as_attachment=True)
 
-@app.route('/download_qrcode/<code>')
+@routes.route('/download_qrcode/<code>')
 def download_qrcode(code):
     """Download QR code as file"""
+    return code_image_response(code, 'qrcode', as_attachment=True)
+
+@routes.store_route('/admin/labels', methods=['GET', 'POST'])
+def admin_labels():
+    """Printable barcode or QR code labels for many items in one request"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'message': 'Akses ditolak!'}), 403
+    
+    params = request.get_json(silent=True) or request.values
+    kind = params.get('kind', 'barcode')
+    file_format = params.get('format', 'pdf')
+    if kind not in ('barcode', 'qrcode') or file_format not in LABEL_FORMATS:
+        return jsonify({'success': False, 'message': 'Jenis atau format label tidak valid!'}), 400
     try:
-        import qrcode
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(code)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return send_file(buffer, mimetype='image/png', as_attachment=True,
-                        download_name=f'qrcode_{code}.png')
+        columns = min(max(int(params.get('columns', 3)), 1), 6)
+    except (TypeError, ValueError):
+        columns = 3
+    
+    # Explicit codes win; otherwise filter the catalogue by search query or low stock
+    store = g.store
+    codes = params.get('codes')
+    if codes:
+        if isinstance(codes, str):
+            codes = codes.split(',')
+        codes = [str(code).strip() for code in codes if str(code).strip()]
+    elif params.get('q'):
+        codes = [item['kode'] for item in
+                 store.search_index.search(params['q'], limit=LABEL_SHEET_MAX, in_stock_only=False)]
+    elif params.get('low_stock'):
+        codes = [item['kode'] for item in store.items.values() if item['stok_akhir'] < LOW_STOCK_THRESHOLD]
+    else:
+        codes = [item['kode'] for item in store.items.values()]
+    
+    if not codes:
+        return jsonify({'success': False, 'message': 'Tidak ada barang untuk dicetak!'}), 400
+    if len(codes) > LABEL_SHEET_MAX:
+        return jsonify({'success': False,
+                        'message': f'Maksimal {LABEL_SHEET_MAX} label per permintaan!'}), 400
+    # A PNG is one sheet; more labels than fit on it go in a PDF or a zip
+    if file_format == 'png' and len(codes) > labels_per_page(kind, columns):
+        return jsonify({'success': False,
+                        'message': f'Maksimal {labels_per_page(kind, columns)} label untuk format PNG, '
+                                   f'gunakan PDF atau ZIP!'}), 400
+    
+    try:
+        images = render_batch(image_cache, codes, kind)
+        labels = []
+        for code, png in zip(codes, images):
+            item = get_item_by_code(store, code)
+            labels.append((code, item['nama'] if item else '', png))
+        data = compose_label_sheet(labels, kind, file_format, columns)
     except ImportError as e:
-        app.logger.error(f"QR code library import error: {e}")
-        return "QR code library not available", 404
+        current_app.logger.error(f"Label library import error: {e}")
+        return "Label library not available", 404
     except Exception as e:
-        app.logger.error(f"Error downloading QR code: {e}")
-        return f"Error downloading QR code: {str(e)}", 500
+        current_app.logger.error(f"Error generating labels: {e}")
+        return f"Error generating labels: {str(e)}", 500
+    
+    return send_file(io.BytesIO(data), mimetype=LABEL_FORMATS[file_format],
+                     as_attachment=file_format != 'png',
+                     download_name=f'label_{kind}.{file_format}')
 
-@app.route('/admin/items/add', methods=['GET', 'POST'])
+@routes.store_route('/admin/items/add', methods=['GET', 'POST'])
 def admin_add_item():
     """Add new item"""
     if session.get('user_role') != 'admin':
@@ -350,8 +1250,6 @@ def admin_add_item():
         return redirect(url_for('admin_login'))
     
     if request.method == 'POST':
-        global next_item_id
-        
         kode = request.form.get('kode', '')
         nama = request.form.get('nama', '')
         harga_awal = int(request.form.get('harga_awal', 0))
@@ -359,13 +1257,13 @@ def admin_add_item():
         stok_awal = int(request.form.get('stok_awal', 0))
         
         # Check if code already exists
-        if get_item_by_code(kode):
+        if get_item_by_code(g.store, kode):
             flash('Kode barang sudah ada!', 'error')
             return render_template('admin/add_item.html')
         
         # Create new item (profit will be calculated based on actual sales)
         new_item = {
-            'id': next_item_id,
+            'id': None,  # Assigned by the storage backend
             'kode': kode,
             'nama': nama,
             'harga_awal': harga_awal,
@@ -375,22 +1273,49 @@ def admin_add_item():
             'profit': 0  # No profit until items are sold
         }
         
-        items_data[next_item_id] = new_item
-        next_item_id += 1
+        add_item(g.store, new_item)
         
         flash('Barang berhasil ditambahkan!', 'success')
         return redirect(url_for('admin_items'))
     
     return render_template('admin/add_item.html')
 
-@app.route('/admin/items/edit/<int:item_id>', methods=['GET', 'POST'])
+@routes.store_route('/admin/items/import', methods=['POST'])
+def admin_import_items():
+    """Bulk insert and update items from an uploaded CSV, NDJSON or JSON file"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'message': 'Akses ditolak!'}), 403
+    
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'message': 'Pilih berkas yang akan diimpor!'}), 400
+    dry_run = request.values.get('dry_run') == '1'
+    
+    try:
+        file_format = item_import.detect_format(upload.filename, request.values.get('format'))
+        inserted, updated, errors = import_items(g.store, item_import.read_rows(upload.stream, file_format),
+                                                 dry_run=dry_run)
+    except item_import.InvalidFile as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': 'Pemeriksaan selesai' if dry_run else 'Impor selesai',
+        'dry_run': dry_run,
+        'inserted': inserted,
+        'updated': updated,
+        'error_count': len(errors),
+        'errors': errors[:IMPORT_MAX_ERRORS]
+    })
+
+@routes.store_route('/admin/items/edit/<int:item_id>', methods=['GET', 'POST'])
 def admin_edit_item(item_id):
     """Edit existing item"""
     if session.get('user_role') != 'admin':
         flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
         return redirect(url_for('admin_login'))
     
-    item = items_data.get(item_id)
+    item = g.store.items.get(item_id)
     if not item:
         flash('Barang tidak ditemukan!', 'error')
         return redirect(url_for('admin_items'))
@@ -403,212 +1328,435 @@ def admin_edit_item(item_id):
         stok_akhir = int(request.form.get('stok_akhir', 0))
         
         # Check if code already exists for other items
-        existing_item = get_item_by_code(kode)
+        existing_item = get_item_by_code(g.store, kode)
         if existing_item and existing_item['id'] != item_id:
             flash('Kode barang sudah digunakan oleh barang lain!', 'error')
             return render_template('admin/edit_item.html', item=item)
         
-        # Update item
-        item['kode'] = kode
-        item['nama'] = nama
-        item['harga_awal'] = harga_awal
-        item['harga_jual'] = harga_jual
-        item['stok_akhir'] = stok_akhir
-        # Update profit using the new function
-        update_item_profit(item)
+        # Update item (profit is recalculated along with it)
+        update_item(g.store, item, kode=kode, nama=nama, harga_awal=harga_awal,
+                    harga_jual=harga_jual, stok_akhir=stok_akhir)
         
         flash('Barang berhasil diperbarui!', 'success')
         return redirect(url_for('admin_items'))
     
     return render_template('admin/edit_item.html', item=item)
 
-@app.route('/admin/items/delete/<int:item_id>')
+@routes.store_route('/admin/items/delete/<int:item_id>')
 def admin_delete_item(item_id):
     """Delete item"""
     if session.get('user_role') != 'admin':
         flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
         return redirect(url_for('admin_login'))
     
-    if item_id in items_data:
-        del items_data[item_id]
+    if remove_item(g.store, item_id) is not None:
         flash('Barang berhasil dihapus!', 'success')
     else:
         flash('Barang tidak ditemukan!', 'error')
     
     return redirect(url_for('admin_items'))
 
-@app.route('/admin/reports')
+@routes.store_route('/admin/reports')
 def admin_reports():
     """View reports"""
     if session.get('user_role') != 'admin':
         flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
         return redirect(url_for('admin_login'))
     
-    # Calculate daily sales
-    daily_sales = {}
-    for transaction in transactions_data:
-        date = transaction['timestamp'].split()[0]  # Get date part
-        if date not in daily_sales:
-            daily_sales[date] = {'total': 0, 'profit': 0, 'count': 0}
-        daily_sales[date]['total'] += transaction['total']
-        daily_sales[date]['profit'] += transaction['profit']
-        daily_sales[date]['count'] += 1
-    
-    # Top selling items
-    item_sales = {}
-    for transaction in transactions_data:
-        for item in transaction['items']:
-            kode = item['kode']
-            if kode not in item_sales:
-                item_sales[kode] = {'nama': item['nama'], 'quantity': 0, 'revenue': 0}
-            item_sales[kode]['quantity'] += item['quantity']
-            item_sales[kode]['revenue'] += item['subtotal']
-    
-    # Sort by quantity sold
-    top_items = sorted(item_sales.items(), key=lambda x: x[1]['quantity'], reverse=True)[:10]
+    # Optional date range; only the transactions inside it are looked at
+    try:
+        start, end = request_period()
+    except ValueError:
+        flash('Tanggal tidak valid!', 'error')
+        start = end = None
+    store = g.store
+    if start or end:
+        # Rolled up from the ledger rows of just the selected range, located by bisection
+        records = store.transactions.between(start, end)
+        daily_sales = store.sales_ledger.daily(start, end)
+        top_items = store.sales_ledger.top_items(10, start, end)
+        summary = store.sales_ledger.totals(start, end)
+        hourly_sales = store.sales_ledger.hourly(start, end)
+    else:
+        # Daily, hourly and top selling items are maintained as sales are recorded
+        records = store.transactions
+        daily_sales = store.sales_aggregates.daily_sales()
+        top_items = store.sales_aggregates.top_items()
+        summary = store.sales_aggregates.summary()
+        hourly_sales = store.sales_aggregates.hourly_sales()
+    
+    # Report figures are computed here rather than in the template
+    report_figures(summary, daily_sales)
+    
+    # Only one page of transaction details is rendered, newest first
+    page = request.args.get('page', 1, type=int)
+    transactions, pagination = paginate_newest_first(records, page, REPORT_PAGE_SIZE)
+    
+    # Keep the selected range in pagination and export links
+    period = {key: request.args[key] for key in ('from', 'to') if request.args.get(key) and (start or end)}
     
     return render_template('admin/reports.html', 
                          daily_sales=daily_sales, 
                          top_items=top_items,
-                         transactions=transactions_data)
+                         hourly_sales=hourly_sales,
+                         summary=summary,
+                         transactions=transactions,
+                         pagination=pagination,
+                         period=period)
+
+@routes.route('/admin/chain')
+def admin_chain():
+    """Chain report: every store's totals side by side, and combined"""
+    if session.get('user_role') != 'admin':
+        flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
+        return redirect(url_for('admin_login'))
+    
+    try:
+        start, end = request_period()
+    except ValueError:
+        flash('Tanggal tidak valid!', 'error')
+        start = end = None
+    
+    # Combined from each store's running totals (or ledger rollups for a
+    # date range), so the report costs the same however many sales there are
+    store_rows = []
+    daily_tables = []
+    item_tables = []
+    for store in stores.values():
+        if start or end:
+            totals = store.sales_ledger.totals(start, end)
+            daily_tables.append(store.sales_ledger.daily(start, end))
+            item_tables.append(store.sales_ledger.items(start, end))
+        else:
+            totals = store.sales_aggregates.summary()
+        items = list(store.items.values())
+        totals.update(store=store.id, total_items=len(items),
+                      low_stock_count=sum(1 for item in items if item['stok_akhir'] < LOW_STOCK_THRESHOLD))
+        store_rows.append(totals)
+    if start or end:
+        daily_sales = combine_tables(daily_tables)
+        top_items = sorted(combine_tables(item_tables).items(), key=lambda pair: pair[1]['quantity'],
+                           reverse=True)[:10]
+    else:
+        chain = SalesAggregates.merged([store.sales_aggregates for store in stores.values()])
+        daily_sales = chain.daily_sales()
+        top_items = chain.top_items()
+    
+    summary = {name: sum(row[name] for row in store_rows) for name in
+               ('total_transactions', 'total_revenue', 'total_profit', 'total_items_sold', 'total_items')}
+    report_figures(summary, daily_sales)
+    for row in store_rows:
+        row['revenue_share'] = (row['total_revenue'] / summary['total_revenue'] * 100
+                                if summary['total_revenue'] > 0 else 0)
+    
+    period = {key: request.args[key] for key in ('from', 'to') if request.args.get(key) and (start or end)}
+    
+    return render_template('admin/chain.html',
+                         summary=summary,
+                         store_rows=store_rows,
+                         daily_sales=daily_sales,
+                         top_items=top_items,
+                         period=period)
 
-@app.route('/cashier')
+@routes.store_route('/admin/export/<dataset>')
+def admin_export(dataset):
+    """Stream transactions, items or daily sales as CSV or NDJSON"""
+    if session.get('user_role') != 'admin':
+        flash('Akses ditolak! Login sebagai admin terlebih dahulu.', 'error')
+        return redirect(url_for('admin_login'))
+    
+    file_format = request.args.get('format', 'csv')
+    if dataset not in ('transactions', 'items', 'daily_sales') or file_format not in exports.FORMATS:
+        return jsonify({'success': False, 'message': 'Jenis atau format ekspor tidak valid!'}), 400
+    
+    try:
+        start, end = request_period()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Tanggal tidak valid!'}), 400
+    
+    store = g.store
+    if dataset == 'transactions':
+        # Only the requested range is located and read, a chunk at a time
+        cutoff = store.archive.cutoff if store.archive is not None else None
+        if cutoff is not None:
+            # Detail before the cutoff is read back from the archive files
+            archived = store.archive.iter_transactions(start, min(end, cutoff) if end else cutoff)
+            records = itertools.chain(archived, store.transactions.iter_between(max(start, cutoff) if start else cutoff, end))
+        else:
+            records = store.transactions.iter_between(start, end)
+        if file_format == 'csv':
+            chunks = exports.encode_csv(exports.TRANSACTION_COLUMNS, exports.transaction_line_rows(records))
+        else:
+            chunks = exports.encode_ndjson(records)
+    else:
+        if dataset == 'items':
+            rows = (dict(item) for item in list(store.items.values()))
+            columns = exports.ITEM_COLUMNS
+        else:
+            rows = exports.daily_sales_rows(store.sales_aggregates.daily_sales(), start, end)
+            columns = exports.DAILY_SALES_COLUMNS
+        chunks = exports.encode_csv(columns, rows) if file_format == 'csv' else exports.encode_ndjson(rows)
+    
+    mimetype, extension = exports.FORMATS[file_format]
+    # Exports of the default store keep their names from before stores existed
+    filename = f'{dataset}.{extension}' if store is default_store else f'{dataset}_{store.id}.{extension}'
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = exports.gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@routes.store_route('/cashier')
 def cashier_pos():
     """Cashier POS interface"""
     session['user_role'] = 'cashier'  # Simple role assignment for cashier
-    return render_template('cashier/pos.html', items=list(items_data.values()))
+    # Only the first in-stock items are rendered; pos.js searches its local
+    # copy of the catalogue (see cashier_catalogue) for the rest
+    store = g.store
+    items = list(itertools.islice((item for item in list(store.items.values()) if item['stok_akhir'] > 0),
+                                  POS_GRID_ITEMS))
+    return render_template('cashier/pos.html', items=items, item_count=len(store.items))
+
+@routes.store_route('/cashier/catalogue')
+def cashier_catalogue():
+    """The item catalogue as a full snapshot, or only the changes since a version
+
+    `since` is the version of a previous response. The ETag is the catalogue
+    version, so a client that is up to date gets a 304 without any work.
+    """
+    store = g.store
+    catalogue_log = store.catalogue_log
+    etag = f'catalogue-{catalogue_log.cursor()}'
+    # Weak match: compress_response marks the ETag of a compressed body weak
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        since = request.args.get('since')
+        delta = catalogue_log.changes_since(since) if since else None
+        if delta is None:
+            # Read the version first: items changed meanwhile are sent again in the next delta
+            version = catalogue_log.version
+            cached_version, body = store.catalogue_snapshot
+            if cached_version == version:
+                catalogue_snapshot_stats.hit()
+            else:
+                catalogue_snapshot_stats.miss()
+                body = current_app.json.dumps({'version': catalogue_log.cursor(version), 'full': True,
+                                       'items': list(store.items.values()), 'deleted': []})
+                store.catalogue_snapshot = (version, body)
+        else:
+            version, changed, deleted = delta
+            items = [item for item in map(store.items.get, changed) if item is not None]
+            body = current_app.json.dumps({'version': catalogue_log.cursor(version), 'full': False,
+                                   'items': items, 'deleted': deleted})
+        response = current_app.response_class(body, mimetype='application/json')
+        etag = f'catalogue-{catalogue_log.cursor(version)}'
+    response.set_etag(etag)
+    # Always revalidate: the catalogue changes with every sale
+    response.cache_control.no_cache = True
+    return response
 
-@app.route('/cashier/search_item')
+@routes.store_route('/cashier/search_item')
 def search_item():
     """Search item by code or name"""
-    query = request.args.get('q', '').lower()
-    results = []
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
     
-    for item in items_data.values():
-        if (query in item['kode'].lower() or 
-            query in item['nama'].lower()) and item['stok_akhir'] > 0:
-            results.append(item)
+    # Only in-stock items are returned, best matches first
+    started = time.perf_counter()
+    results = g.store.search_index.search(query, limit=limit)
+    search_latency.observe(time.perf_counter() - started)
+    search_count.inc(store=g.store.id, result='found' if results else 'empty')
     
     return jsonify(results)
 
-@app.route('/cashier/process_sale', methods=['POST'])
+@routes.store_route('/cashier/process_sale', methods=['POST'])
 def process_sale():
     """Process a sale transaction"""
     data = request.get_json()
     cart_items = data.get('items', [])
     payment_amount = data.get('payment_amount', 0)
+    key = data.get('key')
+    store = g.store
     
     if not cart_items:
+        sale_count.inc(store=store.id, source='till', status='rejected')
         return jsonify({'success': False, 'message': 'Keranjang kosong!'})
+    if key is not None and (not isinstance(key, str) or not key or len(key) > SALE_KEY_MAX_LENGTH):
+        sale_count.inc(store=store.id, source='till', status='rejected')
+        return jsonify({'success': False, 'message': 'Kunci transaksi tidak valid!'})
     
-    global next_transaction_id
-    transaction_items = []
-    total_amount = 0
-    total_profit = 0
-    
-    # Process each item in cart
-    for cart_item in cart_items:
-        kode = cart_item['kode']
-        quantity = cart_item['quantity']
-        
-        # Find item in inventory
-        item = get_item_by_code(kode)
-        if not item:
-            return jsonify({'success': False, 'message': f'Barang {kode} tidak ditemukan!'})
-        
-        # Check stock
-        if item['stok_akhir'] < quantity:
-            return jsonify({'success': False, 'message': f'Stok {item["nama"]} tidak mencukupi!'})
-        
-        # Calculate subtotal and profit
-        subtotal = item['harga_jual'] * quantity
-        profit = calculate_profit(item['harga_awal'], item['harga_jual'], quantity)
-        
-        # Update stock
-        item['stok_akhir'] -= quantity
-        
-        # Update item profit after stock change
-        update_item_profit(item)
-        
-        # Add to transaction items
-        transaction_items.append({
-            'kode': kode,
-            'nama': item['nama'],
-            'harga_jual': item['harga_jual'],
-            'quantity': quantity,
-            'subtotal': subtotal
-        })
-        
-        total_amount += subtotal
-        total_profit += profit
-    
-    # Calculate change
-    change = payment_amount - total_amount if payment_amount >= total_amount else 0
-    
-    # Create transaction record
-    transaction = {
-        'id': next_transaction_id,
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'items': transaction_items,
-        'total': total_amount,
-        'profit': total_profit,
-        'payment_amount': payment_amount,
-        'change': change
-    }
-    
-    transactions_data.append(transaction)
-    next_transaction_id += 1
+    try:
+        transaction = checkout(store, cart_items, payment_amount, key=key)
+    except SaleError as e:
+        sale_count.inc(store=store.id, source='till', status='rejected')
+        return jsonify({'success': False, 'message': str(e)})
+    except DuplicateSale as e:
+        # A till resending a sale whose response it never got
+        if e.transaction_id == SALE_PENDING:
+            sale_count.inc(store=store.id, source='till', status='pending')
+            return jsonify({'success': False, 'pending': True,
+                            'message': 'Transaksi sedang diproses, coba lagi sebentar lagi!'}), 409
+        sale_count.inc(store=store.id, source='till', status='duplicate')
+        return jsonify({'success': False, 'duplicate': True, 'transaction_id': e.transaction_id,
+                        'message': f'Transaksi sudah tercatat dengan ID {e.transaction_id}'})
+    sale_count.inc(store=store.id, source='till', status='created')
     
     return jsonify({
         'success': True, 
         'message': 'Transaksi berhasil!',
         'transaction_id': transaction['id'],
-        'total': total_amount,
+        'total': transaction['total'],
         'payment_amount': payment_amount,
-        'change': change,
+        'change': transaction['change'],
         'timestamp': transaction['timestamp'],
-        'items': transaction_items
+        # Margins stay with the admin reports and aggregates
+        'items': [{name: line[name] for name in Line.RECEIPT} for line in transaction['items']]
+    })
+
+@routes.store_route('/cashier/process_sales', methods=['POST'])
+def process_sales():
+    """Commit a batch of sales a till recorded offline"""
+    data = request.get_json(silent=True) or {}
+    sales = data.get('sales')
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'success': False, 'message': 'Tidak ada transaksi untuk dikirim!'}), 400
+    if len(sales) > SALE_BATCH_MAX:
+        return jsonify({'success': False,
+                        'message': f'Maksimal {SALE_BATCH_MAX} transaksi per pengiriman!'}), 400
+    
+    results = checkout_batch(g.store, sales)
+    for result in results:
+        sale_count.inc(store=g.store.id, source='offline', status=result['status'])
+    return jsonify({
+        'success': True,
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'results': results
     })
 
-@app.route('/cashier/history')
+@routes.store_route('/events')
+def event_stream():
+    """Server-sent events: stock levels, new transactions and low-stock crossings
+
+    `topics` picks a comma-separated subset of stock, transaction and
+    low_stock. A 'resync' event means the client fell behind and missed
+    updates, so it should reload what it shows. Only served with
+    KASIR_LIVE_EVENTS=1, as each stream holds a worker thread.
+    """
+    if not LIVE_EVENTS:
+        return jsonify({'success': False, 'message': 'Pembaruan langsung tidak diaktifkan!'}), 404
+    topics = [topic for topic in request.args.get('topics', '').split(',') if topic]
+    unknown = set(topics) - EVENT_TOPICS
+    if unknown:
+        return jsonify({'success': False,
+                        'message': f'Topik tidak dikenal: {", ".join(sorted(unknown))}'}), 400
+    event_broker = g.store.event_broker
+    subscription = event_broker.subscribe(topics)
+    
+    def stream():
+        try:
+            yield from subscription.stream(keepalive=EVENT_KEEPALIVE)
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@routes.route('/metrics')
+def prometheus_metrics():
+    """Request latency, sale, search, image render and cache metrics for Prometheus"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'success': False, 'message': 'Akses ditolak!'}), 403
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@routes.route('/admin/profiles/<profile_id>')
+def admin_profile(profile_id):
+    """A profiled request's samples as collapsed stacks, by its X-Kasir-Profile-Id"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'message': 'Akses ditolak!'}), 403
+    
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({'success': False, 'message': 'Profil tidak ditemukan!'}), 404
+    return Response(profile, content_type='text/plain; charset=utf-8')
+
+@routes.store_route('/cashier/history')
 def cashier_history():
     """View transaction history"""
-    # Show last 50 transactions
-    recent_transactions = transactions_data[-50:] if len(transactions_data) > 50 else transactions_data
-    recent_transactions.reverse()  # Show newest first
-    
-    # Calculate summary statistics and add item count to each transaction
-    total_transactions = len(recent_transactions)
-    total_items_sold = 0
-    total_revenue = 0
-    total_profit = 0
-    
-    # Add item count to each transaction for easy display
-    for transaction in recent_transactions:
-        total_revenue += transaction['total']
-        total_profit += transaction['profit']
-        
-        # Calculate item count for this transaction
-        transaction_item_count = 0
-        for item in transaction['items']:
-            transaction_item_count += item['quantity']
-            total_items_sold += item['quantity']
-        
-        # Add item count to transaction for template use
-        transaction['item_count'] = transaction_item_count
-    
-    summary = {
-        'total_transactions': total_transactions,
-        'total_items_sold': total_items_sold,
-        'total_revenue': total_revenue,
-        'total_profit': total_profit
-    }
+    # Newest first, one page at a time from the recent transactions window;
+    # item counts and the summary are maintained as sales are recorded
+    before = request.args.get('before', type=int)
+    recent_transactions = g.store.recent_transactions
+    transactions, next_cursor = recent_transactions.page(before, HISTORY_PAGE_SIZE)
     
     return render_template('cashier/history.html', 
-                         transactions=recent_transactions,
-                         summary=summary)
+                         transactions=transactions,
+                         summary=recent_transactions.summary(),
+                         before=before,
+                         next_cursor=next_cursor)
+
+def configure_logging(level):
+    """Log to stderr at `level`, a level name such as INFO or DEBUG"""
+    level = level.upper() if isinstance(level, str) else level
+    logging.basicConfig(level=level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger().setLevel(level)
+
+def create_app(database_url=None, journal_dir=None, sample_data=None, log_level=None):
+    """Build the application: logging, storage backend, persisted data and routes
+
+    Arguments left out are read from DATABASE_URL, KASIR_JOURNAL_DIR,
+    KASIR_SAMPLE_DATA (1 puts the demo items and sales into an empty store)
+    and KASIR_LOG_LEVEL (default INFO). The catalogue, sales and indexes are
+    module state, so a process has one application; create_app raises
+    RuntimeError when it is called again.
+    """
+    global app, storage, static_assets
+    if storage is not None:
+        raise RuntimeError('The application was already created in this process')
+    configure_logging(log_level or os.environ.get("KASIR_LOG_LEVEL", "INFO"))
+    if sample_data is None:
+        sample_data = os.environ.get("KASIR_SAMPLE_DATA") == "1"
+    
+    # Static files are served by static_file, from memory
+    app = Flask(__name__, static_folder=None)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    app.json = RecordJSONProvider(app)
+    
+    # Changes are written through to a database when DATABASE_URL is set, a
+    # crash-safe journal when KASIR_JOURNAL_DIR is set, memory only otherwise
+    storage = create_storage(
+        app,
+        database_url=database_url or os.environ.get("DATABASE_URL"),
+        journal_dir=journal_dir or os.environ.get("KASIR_JOURNAL_DIR"),
+        commit_window=int(os.environ.get("KASIR_JOURNAL_WINDOW_MS", 50)) / 1000,
+        snapshot_every=int(os.environ.get("KASIR_SNAPSHOT_EVERY", 10000)))
+    atexit.register(storage.close)
+    static_assets = assets.StaticAssets(os.path.join(app.root_path, 'static'))
+    
+    # Load persisted data, then the sample data if asked for and the default store is empty
+    with app.app_context():
+        load_from_storage()
+        if sample_data:
+            initialize_sample_data(default_store)
+    
+    if ARCHIVE_ENABLED:
+        threading.Thread(target=compaction_loop, args=(app,), name='compaction', daemon=True).start()
+    
+    routes.register(app)
+    return app
 
+def __getattr__(name):
+    # `from app import app` (main.py, gunicorn app:app) creates the application
+    # on first use, so importing this module alone starts nothing
+    if name == 'app':
+        return create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
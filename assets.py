@@ -0,0 +1,118 @@
+"""Fingerprinted, precompressed static files and compression of dynamic responses.
+
+Every file under static/ is read once at startup, hashed and, when it is
+text, compressed with gzip and (when the optional brotli package is
+installed) brotli at their highest levels. url_for('static', ...) links to
+the fingerprinted name, e.g. js/pos.<hash>.js. A fingerprinted URL always
+has the same content, so it is served as immutable for a year, and a
+changed file gets a new URL. The plain name still works and is revalidated
+with its ETag.
+
+HTML and JSON built per request are compressed when they reach a size
+threshold, at a fast level, with brotli or gzip as Accept-Encoding allows.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Encodings in order of preference; brotli only when it is installed
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Per-response compression trades ratio for speed; static files get the maximum once
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class StaticAsset:
+    """One static file: its bytes in every encoding that makes it smaller"""
+
+    __slots__ = ('name', 'mimetype', 'etag', 'mtime', 'encodings')
+
+    def __init__(self, name, mimetype, etag, mtime, encodings):
+        self.name = name
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+        self.encodings = encodings  # encoding ('identity', 'gzip', 'br') -> bytes
+
+
+class StaticAssets:
+    """The files of a static folder in memory, by plain and fingerprinted name"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._assets = {}        # plain or fingerprinted name -> StaticAsset
+        self._fingerprints = {}  # plain name -> fingerprinted name
+        self.refresh()
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def refresh(self):
+        """(Re)load the files that are new or changed since the last load"""
+        if not os.path.isdir(self.folder):
+            return
+        for directory, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                mtime = os.stat(path).st_mtime_ns
+                current = self._assets.get(name)
+                if current is None or current.mtime != mtime:
+                    self._load(name, path, mtime)
+
+    def url_name(self, name):
+        """The fingerprinted name to link to, or `name` itself for a file that is not known"""
+        return self._fingerprints.get(name, name)
+
+    def get(self, name):
+        """The asset a plain or fingerprinted name refers to, or None"""
+        return self._assets.get(name)
+
+    def _load(self, name, path, mtime):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encodings = {'identity': data}
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                compressed = compress(data, encoding, best=True)
+                if len(compressed) < len(data):
+                    encodings[encoding] = compressed
+        stem, extension = os.path.splitext(name)
+        fingerprinted = f'{stem}.{digest}{extension}'
+        asset = StaticAsset(name, mimetype, digest, mtime, encodings)
+        self._assets[name] = self._assets[fingerprinted] = asset
+        self._fingerprints[name] = fingerprinted
+
+
+def compress(data, encoding, best=False):
+    """`data` compressed as `encoding` ('gzip' or 'br'); `best` for static files"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output, and so the bytes served, deterministic
+        return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+    raise ValueError(f'Unknown content encoding: {encoding}')
+
+
+def choose_encoding(accept_encodings, available=ENCODINGS):
+    """The preferred encoding among `available` that the client accepts, or 'identity'
+
+    `accept_encodings` is a request's parsed Accept-Encoding header.
+    """
+    for encoding in ENCODINGS:
+        if encoding in available and accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
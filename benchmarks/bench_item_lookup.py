@@ -0,0 +1,67 @@
+"""Benchmark item lookup by code as the catalogue grows.
+
+Usage: python benchmarks/bench_item_lookup.py
+
+Prints the average cost of get_item_by_code next to the old linear scan for
+catalogues of increasing size. The indexed lookup should stay flat while the
+scan grows with the number of items.
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as pos  # noqa: E402
+
+pos.create_app(log_level='WARNING')
+
+SIZES = [1_000, 10_000, 40_000, 100_000]
+LOOKUPS = 2_000
+
+
+def seed_catalogue(size):
+    """Replace the catalogue with `size` generated items"""
+    pos.default_store.items.clear()
+    pos.default_store.items_by_code.clear()
+    for item_id in range(1, size + 1):
+        pos.add_item(pos.default_store, {
+            'id': item_id,
+            'kode': f'BRG{item_id:06d}',
+            'nama': f'Barang {item_id}',
+            'harga_awal': 1000,
+            'harga_jual': 1500,
+            'stok_awal': 100,
+            'stok_akhir': 100,
+            'profit': 0
+        })
+
+
+def linear_lookup(kode):
+    """The pre-index lookup, kept here as the baseline"""
+    for item in pos.default_store.items.values():
+        if item['kode'] == kode:
+            return item
+    return None
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'items':>8}  {'indexed (us)':>13}  {'linear (us)':>12}")
+    for size in SIZES:
+        seed_catalogue(size)
+        codes = [f'BRG{rng.randint(1, size):06d}' for _ in range(LOOKUPS)]
+
+        indexed = timeit.timeit(lambda: [pos.get_item_by_code(pos.default_store, c) for c in codes], number=5)
+        # The scan is slow enough that a fraction of the codes gives a stable number
+        sample = codes[:50]
+        linear = timeit.timeit(lambda: [linear_lookup(c) for c in sample], number=1)
+
+        indexed_us = indexed / (5 * len(codes)) * 1e6
+        linear_us = linear / len(sample) * 1e6
+        print(f'{size:>8}  {indexed_us:>13.3f}  {linear_us:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
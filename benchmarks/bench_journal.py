@@ -0,0 +1,73 @@
+"""Benchmark journaled sale latency and crash recovery time.
+
+Usage: python benchmarks/bench_journal.py
+
+Commits sales through JournalStorage and reports per-sale latency, then
+measures how long a fresh process would take to recover. At most
+SNAPSHOT_EVERY journal records are replayed; the rest of the recovery time
+is loading the snapshot, which grows with the size of the stored state.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import JournalStorage  # noqa: E402
+
+SALES = [10_000, 50_000]
+SNAPSHOT_EVERY = 5_000
+
+
+def make_sale():
+    return {
+        'id': None,
+        'timestamp': '2025-08-03 14:30:15',
+        'items': [{'kode': 'BRG001', 'nama': 'Buku Tulis', 'harga_jual': 5000,
+                   'quantity': 2, 'subtotal': 10000, 'profit': 4000}],
+        'total': 10000,
+        'profit': 4000,
+        'payment_amount': 10000,
+        'change': 0
+    }
+
+
+def run(sales):
+    directory = tempfile.mkdtemp(prefix='kasir-journal-')
+    try:
+        storage = JournalStorage(directory, commit_window=0.05, snapshot_every=SNAPSHOT_EVERY)
+        item = {'id': None, 'kode': 'BRG001', 'nama': 'Buku Tulis', 'harga_awal': 3000,
+                'harga_jual': 5000, 'stok_awal': 10 ** 9, 'stok_akhir': 10 ** 9}
+        item_id, _ = storage.insert_item(item)
+
+        latencies = []
+        for _ in range(sales):
+            start = time.perf_counter()
+            storage.commit_sale(make_sale(), [(item_id, 2)])
+            latencies.append(time.perf_counter() - start)
+        storage.close()
+
+        start = time.perf_counter()
+        recovered = JournalStorage(directory, snapshot_every=SNAPSHOT_EVERY)
+        recovery = time.perf_counter() - start
+        assert len(recovered.load()[2]) == sales
+        recovered.close()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+        print(f'{sales:>8}  {p50:>9.1f}  {p99:>9.1f}  {recovery * 1000:>12.1f}')
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    print(f"{'sales':>8}  {'p50 (us)':>9}  {'p99 (us)':>9}  {'recover (ms)':>12}")
+    for sales in SALES:
+        run(sales)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark report rollups: dict loops over transactions vs the columnar ledger.
+
+Usage: python benchmarks/bench_ledger.py [lines]
+
+Builds `lines` sold lines (default 1,000,000) both as transaction dicts and
+in a SalesLedger, then times per-day, per-item and per-hour revenue/profit
+rollups each way. The ledger is timed with NumPy when it is installed and
+with its plain-loop fallback.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ledger  # noqa: E402
+from aggregates import line_profit  # noqa: E402
+
+ITEMS = 2000
+DAYS = 365
+
+
+def make_transactions(lines):
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    step = DAYS * 86400 / (lines / 2.5)
+    transactions = []
+    count = 0
+    moment = start
+    while count < lines:
+        moment += timedelta(seconds=rng.expovariate(1 / step))
+        basket = []
+        for _ in range(min(rng.randint(1, 4), lines - count)):
+            number = rng.randrange(ITEMS)
+            quantity = rng.randint(1, 5)
+            price = 1000 + number * 10
+            basket.append({'kode': f'BRG{number:05d}', 'nama': f'Barang {number}', 'harga_jual': price,
+                           'quantity': quantity, 'subtotal': price * quantity,
+                           'profit': price // 3 * quantity})
+        count += len(basket)
+        transactions.append({
+            'id': len(transactions) + 1,
+            'timestamp': moment.strftime('%Y-%m-%d %H:%M:%S'),
+            'items': basket,
+            'total': sum(line['subtotal'] for line in basket),
+            'profit': sum(line['profit'] for line in basket)
+        })
+    return transactions
+
+
+def dict_reports(transactions):
+    """The per-request loops the reports used before the ledger"""
+    daily, items, hourly = {}, {}, {}
+    for transaction in transactions:
+        date, clock = transaction['timestamp'].split()
+        hour = int(clock[:2])
+        for key, table in ((date, daily), (hour, hourly)):
+            totals = table.setdefault(key, {'total': 0, 'profit': 0, 'count': 0})
+            totals['total'] += transaction['total']
+            totals['profit'] += transaction['profit']
+            totals['count'] += 1
+        for line in transaction['items']:
+            totals = items.setdefault(line['kode'], {'nama': line['nama'], 'quantity': 0,
+                                                     'revenue': 0, 'profit': 0})
+            totals['quantity'] += line['quantity']
+            totals['revenue'] += line['subtotal']
+            totals['profit'] += line_profit(line)
+    return daily, items, hourly
+
+
+def ledger_reports(sales_ledger):
+    return sales_ledger.daily(), sales_ledger.items(), sales_ledger.hourly()
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f'Building {lines:,} lines...')
+    transactions = make_transactions(lines)
+    sales_ledger = ledger.SalesLedger()
+    start = time.perf_counter()
+    for transaction in transactions:
+        sales_ledger.record(transaction)
+    append = time.perf_counter() - start
+    column_bytes = sum(len(column) * column.itemsize for column in
+                       (getattr(sales_ledger, name) for name in ledger.COLUMNS))
+    print(f'{len(transactions):,} transactions; ledger append {append / lines * 1e6:.2f} us/line, '
+          f'columns {column_bytes / 2 ** 20:.1f} MiB')
+
+    baseline, expected = timed(dict_reports, transactions)
+    print(f'{"dict loops":<22} {baseline * 1000:>9.1f} ms')
+    modes = [True, False] if ledger.NUMPY_AVAILABLE else [False]
+    for numpy_on in modes:
+        ledger.NUMPY_AVAILABLE = numpy_on
+        elapsed, result = timed(ledger_reports, sales_ledger)
+        assert result[0] == expected[0] and result[1] == expected[1] and result[2] == expected[2]
+        label = 'ledger (numpy)' if numpy_on else 'ledger (loops)'
+        print(f'{label:<22} {elapsed * 1000:>9.1f} ms  {baseline / elapsed:>5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Load test of the POS hot paths at a configurable catalogue and sales history size.
+
+Usage: python benchmarks/bench_pos.py [--items N] [--sales N] [--threads N] [--requests N]
+                                      [--scenarios a,b,...] [--output FILE]
+
+Seeds the in-memory catalogue with `items` items and the history with
+`sales` sales spread over `days` days, through the same functions the app
+uses when it loads from storage (1k-100k items and 10k-1M sales are the
+sizes of interest). Then drives every scenario through the Flask test
+client: `requests` requests from one thread, then the same number from each
+of `threads` concurrent threads.
+
+Prints one JSON document: the configuration, seeding time, and per scenario
+and mode the p50/p99/max latency in milliseconds, throughput in requests per
+second and error count, plus the process's peak RSS after seeding and after
+each scenario. Runs are reproducible for a given --seed, so two commits can
+be compared with the same arguments.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as pos  # noqa: E402
+from models import Line, Transaction  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ('search_item', 'process_sale', 'admin_dashboard', 'admin_reports',
+             'admin_reports_range', 'cashier_history', 'barcode', 'qrcode')
+
+# Words item names are made of, so searches match a realistic share of the catalogue
+WORDS = ('Buku', 'Pulpen', 'Pensil', 'Penggaris', 'Kertas', 'Map', 'Spidol', 'Tinta', 'Lem', 'Gunting',
+         'Tulis', 'Gambar', 'Biru', 'Merah', 'Hitam', 'Besar', 'Kecil', 'Isi', 'Lipat', 'Plastik')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def seed(items, sales, days, rng):
+    """Fill the catalogue and sales history; returns the seeded items"""
+    catalogue = []
+    for number in range(items):
+        harga_awal = rng.randrange(1000, 50000, 500)
+        catalogue.append(pos.add_item(pos.default_store, {
+            'id': None,
+            'kode': f'BRG{number:06d}',
+            'nama': ' '.join(rng.sample(WORDS, 3)),
+            'harga_awal': harga_awal,
+            'harga_jual': harga_awal + rng.randrange(500, 10000, 500),
+            'stok_awal': 10 ** 9,
+            'stok_akhir': 10 ** 9,
+            'profit': 0
+        }))
+
+    # Sales are recorded the way load_from_storage replays them: oldest first,
+    # with ids from the storage backend and stock already accounted for
+    first = datetime.now() - timedelta(days=days)
+    step = days * 86400 / max(sales, 1)
+    for number in range(sales):
+        lines = []
+        for item in rng.sample(catalogue, rng.randint(1, 4)):
+            quantity = rng.randint(1, 3)
+            lines.append(Line(item, quantity, item['harga_jual'] * quantity,
+                              pos.calculate_profit(item['harga_awal'], item['harga_jual'], quantity)))
+        total = sum(line['subtotal'] for line in lines)
+        transaction = Transaction.from_dict({
+            'id': None,
+            'timestamp': (first + timedelta(seconds=number * step)).strftime('%Y-%m-%d %H:%M:%S'),
+            'items': lines,
+            'total': total,
+            'profit': sum(line['profit'] for line in lines),
+            'payment_amount': total,
+            'change': 0,
+            'store': pos.default_store.id
+        })
+        transaction['id'], _, _ = pos.storage.commit_sale(transaction, [])
+        pos.record_transaction(pos.default_store, transaction)
+    return catalogue
+
+
+def request_maker(scenario, catalogue, rng):
+    """A function returning the next (method, url, json body) of a scenario"""
+    today = datetime.now().date()
+    newest = pos.default_store.sales_aggregates.transaction_count
+
+    if scenario == 'search_item':
+        def make():
+            item = rng.choice(catalogue)
+            query = rng.choice((item['kode'][-4:], rng.choice(item['nama'].split())[:rng.randint(2, 5)]))
+            return 'GET', f'/cashier/search_item?q={query}', None
+    elif scenario == 'process_sale':
+        def make():
+            basket = [{'kode': item['kode'], 'quantity': rng.randint(1, 3)}
+                      for item in rng.sample(catalogue, rng.randint(1, 4))]
+            return 'POST', '/cashier/process_sale', {'items': basket, 'payment_amount': 10 ** 9}
+    elif scenario == 'admin_dashboard':
+        def make():
+            return 'GET', '/admin/dashboard', None
+    elif scenario == 'admin_reports':
+        def make():
+            return 'GET', f'/admin/reports?page={rng.randint(1, 20)}', None
+    elif scenario == 'admin_reports_range':
+        def make():
+            start = today - timedelta(days=rng.randint(1, 30))
+            end = start + timedelta(days=rng.randint(0, 7))
+            return 'GET', f'/admin/reports?from={start:%Y-%m-%d}&to={end:%Y-%m-%d}', None
+    elif scenario == 'cashier_history':
+        def make():
+            # Mostly the first page, sometimes paging back from a recent sale
+            before = rng.randint(max(newest - 900, 1), newest) if newest and rng.random() < 0.3 else None
+            return 'GET', '/cashier/history' + (f'?before={before}' if before else ''), None
+    elif scenario in ('barcode', 'qrcode'):
+        def make():
+            return 'GET', f'/generate_{scenario}/{rng.choice(catalogue)["kode"]}', None
+    else:
+        raise ValueError(f'Unknown scenario: {scenario}')
+    return make
+
+
+def admin_client():
+    client = pos.app.test_client()
+    client.post('/admin/login', data={'username': pos.ADMIN_USERNAME, 'password': pos.ADMIN_PASSWORD})
+    return client
+
+
+def drive(scenario, catalogue, requests, threads, seed_value):
+    """Latency and throughput of `requests` requests from each of `threads` threads"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        make = request_maker(scenario, catalogue, rng)
+        client = admin_client()
+        own = []
+        failed = 0
+        for _ in range(requests):
+            method, url, body = make()
+            started = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            own.append(time.perf_counter() - started)
+            if response.status_code != 200 or (body is not None and not response.get_json()['success']):
+                failed += 1
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=worker, args=(seed_value + number,)) for number in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'threads': threads,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=10_000, help='catalogue size (default 10000)')
+    parser.add_argument('--sales', type=int, default=100_000, help='sales in the history (default 100000)')
+    parser.add_argument('--days', type=int, default=90, help='days the history is spread over (default 90)')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per thread per scenario (default 200)')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent threads (default 8)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma-separated subset of {", ".join(SCENARIOS)}')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    # Always the in-memory backend: the numbers are about the request paths, not a disk
+    for name in ('DATABASE_URL', 'KASIR_JOURNAL_DIR', 'KASIR_ARCHIVE_DIR'):
+        os.environ.pop(name, None)
+    pos.create_app(sample_data=False, log_level='WARNING')
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    catalogue = seed(args.items, args.sales, args.days, rng)
+    report = {
+        'config': {'items': args.items, 'sales': args.sales, 'days': args.days, 'requests': args.requests,
+                   'threads': args.threads, 'seed': args.seed, 'python': sys.version.split()[0]},
+        'seed_seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb_after_seed': peak_rss_mb(),
+        'scenarios': {}
+    }
+
+    for scenario in scenarios:
+        report['scenarios'][scenario] = {
+            'single': drive(scenario, catalogue, args.requests, 1, args.seed),
+            'concurrent': drive(scenario, catalogue, args.requests, args.threads, args.seed),
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
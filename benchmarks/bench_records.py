@@ -0,0 +1,96 @@
+"""Benchmark memory per item, transaction and line: plain dicts vs slotted records.
+
+Usage: python benchmarks/bench_records.py [items] [transactions]
+
+Builds `items` catalogue items (default 10,000) and `transactions` sales
+(default 200,000, 1-4 lines each) once as the dicts the application used to
+keep and once as models.Item/Transaction/Line records, and reports the bytes
+each takes as measured by tracemalloc.
+"""
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Item, Line, Transaction  # noqa: E402
+
+
+def item_fields(count):
+    return [{'id': number + 1, 'kode': f'BRG{number:05d}', 'nama': f'Barang nomor {number}',
+             'harga_awal': 1000 + number, 'harga_jual': 1500 + number, 'stok_awal': 100,
+             'stok_akhir': 100, 'profit': 0} for number in range(count)]
+
+
+def build_dicts(fields, transactions):
+    rng = random.Random(42)
+    items = [dict(item) for item in fields]
+    sales = []
+    for number in range(transactions):
+        lines = []
+        for item in rng.sample(items, rng.randint(1, 4)):
+            quantity = rng.randint(1, 5)
+            lines.append({'kode': item['kode'], 'nama': item['nama'], 'harga_jual': item['harga_jual'],
+                          'quantity': quantity, 'subtotal': item['harga_jual'] * quantity,
+                          'profit': (item['harga_jual'] - item['harga_awal']) * quantity})
+        total = sum(line['subtotal'] for line in lines)
+        sales.append({'id': number + 1, 'timestamp': f'2025-08-03 {number % 24:02d}:00:00',
+                      'items': lines, 'total': total, 'profit': sum(line['profit'] for line in lines),
+                      'payment_amount': total, 'change': 0})
+    return items, sales
+
+
+def build_records(fields, transactions):
+    rng = random.Random(42)
+    items = [Item.from_dict(item) for item in fields]
+    sales = []
+    for number in range(transactions):
+        lines = []
+        for item in rng.sample(items, rng.randint(1, 4)):
+            quantity = rng.randint(1, 5)
+            lines.append(Line(item, quantity, item['harga_jual'] * quantity,
+                              (item['harga_jual'] - item['harga_awal']) * quantity))
+        total = sum(line['subtotal'] for line in lines)
+        sales.append(Transaction.from_dict({
+            'id': number + 1, 'timestamp': f'2025-08-03 {number % 24:02d}:00:00', 'items': lines,
+            'total': total, 'profit': sum(line['profit'] for line in lines),
+            'payment_amount': total, 'change': 0}))
+    return items, sales
+
+
+def measured(build, fields, transactions):
+    """(items, sales, bytes of the items, bytes of the sales)"""
+    gc.collect()
+    tracemalloc.start()
+    items, _ = build(fields, 0)
+    item_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    gc.collect()
+    tracemalloc.start()
+    _, sales = build(fields, transactions)
+    total_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sales, item_bytes, total_bytes - item_bytes
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    fields = item_fields(items)
+    print(f'{items:,} items, {transactions:,} transactions')
+    results = {}
+    for label, build in (('dicts', build_dicts), ('records', build_records)):
+        sales, item_bytes, sale_bytes = measured(build, fields, transactions)
+        lines = sum(len(sale['items']) for sale in sales)
+        results[label] = sale_bytes
+        print(f'{label:<8} {item_bytes / items:>7.0f} B/item  {sale_bytes / transactions:>7.0f} B/transaction  '
+              f'{sale_bytes / lines:>6.0f} B/line (amortized)  {sale_bytes / 2 ** 20:>7.1f} MiB of sales')
+        del sales
+    print(f'records use {results["records"] / results["dicts"]:.0%} of the dict memory for sales')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark worker startup: importing the app, creating it and its first response.
+
+Usage: python benchmarks/bench_startup.py [runs]
+
+Starts `runs` fresh interpreters (default 10), as a gunicorn worker spawn or
+an autoscaling event would, and times in each the import of app.py, the
+create_app() call and the first request (a cashier search). Also reports
+which heavy optional libraries were loaded by then; the image libraries,
+SQLAlchemy and NumPy should only load when a route needs them.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('qrcode', 'barcode', 'PIL', 'sqlalchemy', 'numpy')
+
+PROBE = f'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(log_level='WARNING')
+created = time.perf_counter()
+response = application.test_client().get('/cashier/search_item?q=a')
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported,
+                  'first_response': answered - created, 'total': answered - started,
+                  'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+'''
+
+
+def probe():
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('DATABASE_URL', 'KASIR_JOURNAL_DIR', 'KASIR_ARCHIVE_DIR')}
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    results = [probe() for _ in range(runs)]
+    print(f'{runs} fresh interpreters, memory storage, no sample data (median / max)')
+    for phase in ('import', 'create_app', 'first_response', 'total'):
+        timings = [result[phase] * 1000 for result in results]
+        print(f'  {phase:<15} {statistics.median(timings):8.1f} ms  {max(timings):8.1f} ms')
+    print(f'  heavy modules loaded: {", ".join(results[-1]["loaded"]) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Concurrency stress test for checkout.
+
+Usage: python benchmarks/stress_checkout.py [threads] [baskets_per_thread] [stores]
+
+Many threads post overlapping baskets for a handful of SKUs with little
+stock through the Flask test client. Afterwards every SKU must have
+non-negative stock, and the units it lost must equal the units in the
+successful transactions. Exits with status 1 if either check fails.
+
+With more than one store (default 1) every store gets the same SKU codes
+and the threads are spread over the stores, so each store's stock must add
+up on its own.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STORES = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+# Stores are configured when the app module is imported
+os.environ['KASIR_STORES'] = ','.join(f'toko{number}' for number in range(STORES))
+
+import app as pos  # noqa: E402
+
+pos.create_app(log_level='WARNING')
+
+SKUS = 12
+STOCK = 150
+
+
+def seed(store):
+    codes = []
+    for number in range(SKUS):
+        item = pos.add_item(store, {
+            'id': None,
+            'kode': f'STRESS{number:03d}',
+            'nama': f'Stress {number}',
+            'harga_awal': 1000,
+            'harga_jual': 1500,
+            'stok_awal': STOCK,
+            'stok_akhir': STOCK,
+            'profit': 0
+        })
+        codes.append(item['kode'])
+    return codes
+
+
+def till(store, codes, baskets, seed_value, results):
+    rng = random.Random(seed_value)
+    client = pos.app.test_client()
+    url = f'/stores/{store.id}/cashier/process_sale'
+    sold = Counter()
+    successes = 0
+    for _ in range(baskets):
+        basket = [{'kode': rng.choice(codes), 'quantity': rng.randint(1, 3)}
+                  for _ in range(rng.randint(1, 4))]
+        response = client.post(url,
+                               json={'items': basket, 'payment_amount': 10 ** 9}).get_json()
+        if response['success']:
+            successes += 1
+            for line in response['items']:
+                sold[line['kode']] += line['quantity']
+    results.append((store, successes, sold))
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    baskets = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    # Switch threads as often as possible to provoke interleavings
+    sys.setswitchinterval(1e-6)
+
+    stores = list(pos.stores.values())
+    # Writes go through the storage backend, which for SQL needs the app context
+    with pos.app.app_context():
+        for store in stores:
+            codes = seed(store)  # the same codes in every store
+    results = []
+    workers = [threading.Thread(target=till, args=(stores[n % len(stores)], codes, baskets, n, results))
+               for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    sold = {store.id: Counter() for store in stores}
+    for store, _, counts in results:
+        sold[store.id].update(counts)
+    successes = sum(count for _, count, _ in results)
+
+    failures = []
+    for store in stores:
+        for kode in codes:
+            item = pos.get_item_by_code(store, kode)
+            if item['stok_akhir'] < 0:
+                failures.append(f'{store.id} {kode}: negative stock {item["stok_akhir"]}')
+            if STOCK - item['stok_akhir'] != sold[store.id][kode]:
+                failures.append(f'{store.id} {kode}: stock dropped by {STOCK - item["stok_akhir"]}, '
+                                f'sold {sold[store.id][kode]}')
+
+    attempts = threads * baskets
+    print(f'{attempts} baskets from {threads} threads over {len(stores)} stores in {elapsed:.2f}s: '
+          f'{successes} sold, {attempts - successes} refused')
+    if failures:
+        print('FAILED')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('OK: stock never negative and matches recorded sales')
+
+
+if __name__ == '__main__':
+    main()
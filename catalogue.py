@@ -0,0 +1,80 @@
+"""Change log of the item catalogue for versioned snapshots and delta sync.
+
+Every change to an item (added, edited, deleted, or its stock moved by a
+sale) bumps the catalogue version and files the item under that version. The
+log keeps only each item's latest change, in version order, so the items
+changed since any version are found by walking back from the newest entry:
+O(changes), however large the catalogue.
+
+Versions count from zero in each process, so they are published as a cursor
+"<epoch>.<version>" where the epoch is random per process; a cursor from
+another process or an earlier run asks for a full snapshot instead of a delta.
+Deleted items are remembered up to `max_deleted` tombstones; cursors older
+than the tombstones that were dropped also get a full snapshot.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class CatalogueLog:
+    """Catalogue version and the version at which each item last changed"""
+
+    def __init__(self, max_deleted=10000):
+        self._lock = threading.Lock()
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.max_deleted = max_deleted
+        self._changes = OrderedDict()  # item id -> (version, deleted), oldest change first
+        self._deleted = 0              # tombstones in _changes
+        self._horizon = 0              # deltas from before this version may miss deletions
+
+    def cursor(self, version=None):
+        """The public cursor of `version` (default: the current one)"""
+        return f'{self.epoch}.{self.version if version is None else version}'
+
+    def touch(self, item_id, deleted=False):
+        """Record a change to one item; returns the new version"""
+        with self._lock:
+            self.version += 1
+            previous = self._changes.pop(item_id, None)
+            if previous is not None and previous[1]:
+                self._deleted -= 1
+            self._changes[item_id] = (self.version, deleted)
+            if deleted:
+                self._deleted += 1
+                if self._deleted > self.max_deleted:
+                    self._drop_tombstones()
+            return self.version
+
+    def changes_since(self, cursor):
+        """(version, changed ids, deleted ids) after `cursor`, newest first
+
+        Returns None when the cursor cannot be answered with a delta (another
+        process's, too old, malformed) and a full snapshot is needed.
+        """
+        epoch, _, number = (cursor or '').partition('.')
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        since = int(number)
+        with self._lock:
+            if since < self._horizon or since > self.version:
+                return None
+            changed, deleted = [], []
+            for item_id in reversed(self._changes):
+                version, gone = self._changes[item_id]
+                if version <= since:
+                    break
+                (deleted if gone else changed).append(item_id)
+            return self.version, changed, deleted
+
+    def _drop_tombstones(self):
+        # Forget the older half of the deletions in one pass
+        target = self.max_deleted // 2
+        for item_id, (version, gone) in list(self._changes.items()):
+            if self._deleted <= target:
+                break
+            if gone:
+                del self._changes[item_id]
+                self._deleted -= 1
+                self._horizon = version
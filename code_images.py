@@ -0,0 +1,385 @@
+"""Barcode and QR code PNG rendering with a shared in-memory cache.
+
+Rendering is deterministic, so a rendered image is fully identified by its
+code and format. Images are cached in an LRU bounded by total bytes, and the
+ETag is derived from the same key, so a conditional request can be answered
+with 304 without rendering or even looking at the cache.
+
+Label sheets for many items render their cache misses in a process pool and
+are composed into a printable PDF (written a page at a time), a one-page
+PNG or a zip of PNGs.
+"""
+import hashlib
+import importlib
+import io
+import itertools
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+from werkzeug.utils import secure_filename
+
+KINDS = ('barcode', 'qrcode')
+
+# Bump when rendering options change so browsers drop their cached copies
+RENDER_VERSION = 1
+
+# Label sheets: A4 at 150 dpi
+SHEET_SIZE = (1240, 1754)
+SHEET_MARGIN = 60
+SHEET_DPI = 150
+LABEL_TEXT_HEIGHT = 44
+
+# Batches smaller than this are rendered in the request thread, where the
+# process pool's pickling round trip would cost more than it saves
+POOL_THRESHOLD = 8
+
+
+# Distribution that provides each optional image library, for error messages
+PACKAGES = {'barcode': 'python-barcode', 'qrcode': 'qrcode', 'PIL': 'Pillow'}
+
+# The image libraries are imported on first use instead of with this module,
+# so worker processes that never render an image never load them
+_modules = {}  # module name -> module, or the message of the ImportError it raised
+_modules_lock = threading.Lock()
+
+
+def _module(name):
+    """An optional image library module, imported once; raises ImportError if it is missing"""
+    module = _modules.get(name)
+    if module is None:
+        with _modules_lock:
+            if name not in _modules:
+                try:
+                    _modules[name] = importlib.import_module(name)
+                except ImportError:
+                    _modules[name] = f'{PACKAGES[name.split(".")[0]]} is not installed'
+            module = _modules[name]
+    if isinstance(module, str):
+        raise ImportError(module)
+    return module
+
+
+def load_libraries(kind):
+    """Import the libraries that render `kind`; raises ImportError if one is missing"""
+    if kind == 'barcode':
+        return _module('barcode'), _module('barcode.writer')
+    if kind == 'qrcode':
+        # qrcode only loads its Pillow backend when the first image is made
+        return _module('qrcode'), _module('qrcode.image.pil')
+    raise ValueError(f'Unknown image kind: {kind}')
+
+
+def render_code_image(code, kind):
+    """Render a barcode or QR code for `code` as PNG bytes"""
+    buffer = io.BytesIO()
+    if kind == 'barcode':
+        barcode, writer = load_libraries(kind)
+        barcode.Code128(code, writer=writer.ImageWriter()).write(buffer)
+    elif kind == 'qrcode':
+        qrcode, _ = load_libraries(kind)
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(code)
+        qr.make(fit=True)
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    else:
+        raise ValueError(f'Unknown image kind: {kind}')
+    return buffer.getvalue()
+
+
+def render_or_none(code, kind):
+    """Like render_code_image, but None for codes the format cannot encode"""
+    try:
+        return render_code_image(code, kind)
+    except ImportError:
+        raise
+    except Exception:
+        return None
+
+
+def image_etag(code, kind):
+    """Strong ETag for the image of `code` in format `kind`"""
+    key = f'{RENDER_VERSION}:{kind}:{code}'.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
+class ImageCache:
+    """Thread-safe LRU of rendered images, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._images = OrderedDict()  # (code, kind) -> png bytes, least recent first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.renders = dict.fromkeys(KINDS, 0)           # images rendered, per kind
+        self.render_seconds = dict.fromkeys(KINDS, 0.0)  # wall time spent rendering them
+
+    def __len__(self):
+        return len(self._images)
+
+    def lookup(self, code, kind):
+        """Cached PNG bytes for `code`, or None without rendering"""
+        key = (code, kind)
+        with self._lock:
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+            return None
+
+    def get(self, code, kind):
+        """PNG bytes for `code`, rendered on a miss"""
+        png = self.lookup(code, kind)
+        if png is not None:
+            return png
+        # Render outside the lock; two threads may race to render the same
+        # image, which is harmless since the result is identical
+        started = time.perf_counter()
+        png = render_code_image(code, kind)
+        self.note_renders(kind, 1, time.perf_counter() - started)
+        self.put(code, kind, png)
+        return png
+
+    def note_renders(self, kind, count, seconds):
+        """Count images rendered for this cache, in this thread or elsewhere"""
+        with self._lock:
+            self.renders[kind] += count
+            self.render_seconds[kind] += seconds
+
+    def put(self, code, kind, png):
+        """Store an already rendered image"""
+        key = (code, kind)
+        if len(png) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._images[key] = png
+            self.size += len(png)
+            while self.size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, code):
+        """Drop every cached image of `code`"""
+        with self._lock:
+            for kind in KINDS:
+                png = self._images.pop((code, kind), None)
+                if png is not None:
+                    self.size -= len(png)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.size = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Forking this multi-threaded server could copy a lock held by
+            # another thread into a worker. Workers are forked from a clean
+            # server process that has imported only this module and the image
+            # libraries instead (spawned where there is no forkserver); they
+            # only receive (code, kind) pairs
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['code_images', 'barcode', 'barcode.writer', 'qrcode',
+                                                'qrcode.image.pil', 'PIL.Image'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=context)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the label rendering processes, if they were started"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def render_batch(cache, codes, kind):
+    """PNG bytes (None if unrenderable) for every code, in order
+
+    Cache hits are reused; misses are rendered across all cores and added
+    to the cache.
+    """
+    images = {}
+    missing = []
+    for code in dict.fromkeys(codes):
+        png = cache.lookup(code, kind)
+        if png is None:
+            missing.append(code)
+        else:
+            images[code] = png
+    started = time.perf_counter()
+    if len(missing) >= POOL_THRESHOLD:
+        load_libraries(kind)
+        chunksize = max(1, len(missing) // (4 * (os.cpu_count() or 1)))
+        rendered = _process_pool().map(render_or_none, missing, itertools.repeat(kind),
+                                       chunksize=chunksize)
+    else:
+        rendered = (render_or_none(code, kind) for code in missing)
+    for code, png in zip(missing, rendered):
+        if png is not None:
+            cache.put(code, kind, png)
+        images[code] = png
+    if missing:
+        cache.note_renders(kind, len(missing), time.perf_counter() - started)
+    return [images[code] for code in codes]
+
+
+def _label_cell(kind, columns):
+    width = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // columns
+    image_height = width // 2 if kind == 'barcode' else width - LABEL_TEXT_HEIGHT
+    return width, image_height + LABEL_TEXT_HEIGHT
+
+
+def _draw_label(sheet, draw, font, box, label):
+    code, nama, png = label
+    left, top, width, height = box
+    padding = 8
+    if png is not None:
+        image = _module('PIL.Image').open(io.BytesIO(png)).convert('RGB')
+        image.thumbnail((width - 2 * padding, height - LABEL_TEXT_HEIGHT - padding))
+        sheet.paste(image, (left + (width - image.width) // 2, top + padding))
+    else:
+        draw.text((left + width // 2, top + (height - LABEL_TEXT_HEIGHT) // 2),
+                  'Kode tidak valid', fill='black', font=font, anchor='mm')
+    caption = f'{nama} ({code})' if nama else code
+    draw.text((left + width // 2, top + height - LABEL_TEXT_HEIGHT // 2),
+              caption[:48], fill='black', font=font, anchor='mm')
+    draw.rectangle((left, top, left + width - 1, top + height - 1), outline='#cccccc')
+
+
+def labels_per_page(kind, columns):
+    """How many labels of a kind fit on one sheet at `columns` labels per row"""
+    _, cell_height = _label_cell(kind, columns)
+    return columns * max((SHEET_SIZE[1] - 2 * SHEET_MARGIN) // cell_height, 1)
+
+
+def _compose_pages(labels, kind, columns, single_page=False):
+    """Sheets of labels, composed one at a time as they are consumed
+
+    A single page is cut to the rows it uses; `labels` must fit on it.
+    """
+    cell_width, cell_height = _label_cell(kind, columns)
+    per_page = labels_per_page(kind, columns)
+    Image, ImageDraw = _module('PIL.Image'), _module('PIL.ImageDraw')
+    font = _module('PIL.ImageFont').load_default()
+    for start in range(0, max(len(labels), 1), per_page):
+        chunk = labels[start:start + per_page]
+        rows = (len(chunk) + columns - 1) // columns
+        height = SHEET_SIZE[1] if not single_page else 2 * SHEET_MARGIN + rows * cell_height
+        sheet = Image.new('RGB', (SHEET_SIZE[0], height), 'white')
+        draw = ImageDraw.Draw(sheet)
+        for position, label in enumerate(chunk):
+            row, column = divmod(position, columns)
+            box = (SHEET_MARGIN + column * cell_width, SHEET_MARGIN + row * cell_height,
+                   cell_width, cell_height)
+            _draw_label(sheet, draw, font, box, label)
+        yield sheet
+
+
+def _write_pdf(fp, pages, page_count, dpi):
+    """Write `page_count` RGB sheets from an iterator as a PDF, one sheet in memory at a time
+
+    Pillow's PDF writer collects every page before writing any, which for
+    a large sheet is gigabytes of bitmaps. Here the object numbers are fixed
+    up front (catalog, page tree, then page, contents and JPEG image of each
+    page), so every page is encoded and written as soon as it is composed.
+    """
+    offsets = []
+
+    def write_object(dictionary, stream=None):
+        offsets.append(fp.tell())
+        fp.write(b'%d 0 obj\n%s\n' % (len(offsets), dictionary))
+        if stream is not None:
+            fp.write(b'stream\n%s\nendstream\n' % stream)
+        fp.write(b'endobj\n')
+
+    fp.write(b'%PDF-1.4\n')
+    write_object(b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = b' '.join(b'%d 0 R' % (3 + 3 * number) for number in range(page_count))
+    write_object(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, page_count))
+    for number, page in enumerate(pages):
+        first = 3 + 3 * number
+        width, height = page.width * 72 / dpi, page.height * 72 / dpi
+        write_object(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R '
+                     b'/Resources << /ProcSet [/PDF /ImageC] /XObject << /image %d 0 R >> >> >>'
+                     % (width, height, first + 1, first + 2))
+        contents = b'q %.2f 0 0 %.2f 0 0 cm /image Do Q' % (width, height)
+        write_object(b'<< /Length %d >>' % len(contents), contents)
+        image = io.BytesIO()
+        page.save(image, format='JPEG')
+        write_object(b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                     b'/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>'
+                     % (page.width, page.height, image.tell()), image.getvalue())
+    xref = fp.tell()
+    fp.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets) + 1))
+    for offset in offsets:
+        fp.write(b'%010d 00000 n \n' % offset)
+    fp.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(offsets) + 1, xref))
+
+
+def compose_label_sheet(labels, kind, file_format='pdf', columns=3):
+    """Printable labels for (code, nama, png) triples as bytes
+
+    `file_format` is 'pdf' (A4 pages), 'png' (one sheet, for at most
+    labels_per_page() labels; raises ValueError for more) or 'zip' (one PNG
+    per distinct code, named safely for extraction).
+    """
+    if file_format == 'zip':
+        buffer = io.BytesIO()
+        # PNGs are already compressed
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            written = set()
+            names = set()
+            for code, _, png in labels:
+                if png is None or code in written:
+                    continue
+                written.add(code)
+                # Codes come from the request, so they must not name paths outside the archive;
+                # codes that sanitize to the same name are numbered
+                name = stem = f'{kind}_{secure_filename(code) or "label"}'
+                for number in itertools.count(2):
+                    if name not in names:
+                        break
+                    name = f'{stem}_{number}'
+                names.add(name)
+                archive.writestr(f'{name}.png', png)
+        return buffer.getvalue()
+    buffer = io.BytesIO()
+    if file_format == 'png':
+        if len(labels) > labels_per_page(kind, columns):
+            raise ValueError(f'A PNG label sheet holds at most {labels_per_page(kind, columns)} labels')
+        next(_compose_pages(labels, kind, columns, single_page=True)).save(buffer, format='PNG')
+    elif file_format == 'pdf':
+        per_page = labels_per_page(kind, columns)
+        page_count = max((len(labels) + per_page - 1) // per_page, 1)
+        _write_pdf(buffer, _compose_pages(labels, kind, columns), page_count, SHEET_DPI)
+    else:
+        raise ValueError(f'Unknown label sheet format: {file_format}')
+    return buffer.getvalue()
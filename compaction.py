@@ -0,0 +1,173 @@
+"""Retention for old transactions: a gzip archive on disk plus rollup rows.
+
+Transactions older than the retention period leave memory. Their full
+detail is appended to one gzip NDJSON file per day, and each archived day is
+summarized as one rollup row per item and hour. The rows keep dashboard
+totals, reports and per-hour figures exact: the application folds them into
+its aggregates and ledger on start instead of loading the archived history.
+
+A day's rows are always recomputed from that day's whole archive file, and
+transactions already in the file are skipped by id, so archiving the same
+transactions twice (a retry after a crash, or several workers sharing one
+database) never counts them twice.
+
+Layout of the archive directory:
+
+    rollups.json                        cutoff and rollup rows, written atomically
+    transactions-YYYY-MM-DD.ndjson.gz   archived transactions of one day
+    archive.lock                        serializes archiving between processes
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from aggregates import line_profit
+from models import as_json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def rollup_rows(transactions):
+    """[hour, kode, nama, quantity, revenue, profit, transactions] per item and hour"""
+    rows = {}
+    for transaction in transactions:
+        hour = transaction['timestamp'][:13] + ':00:00'
+        for position, line in enumerate(transaction['items']):
+            row = rows.get((hour, line['kode']))
+            if row is None:
+                row = rows[(hour, line['kode'])] = [hour, line['kode'], line['nama'], 0, 0, 0, 0]
+            row[3] += line['quantity']
+            row[4] += line['subtotal']
+            row[5] += line_profit(line)
+            row[6] += 1 if position == 0 else 0
+    return [rows[key] for key in sorted(rows)]
+
+
+class TransactionArchive:
+    """Archived transactions by day and the rollup rows that replace them in memory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.cutoff = None  # every transaction before this datetime has been archived
+        self.days = {}      # date -> rollup rows of that day
+        self._load()
+
+    def rows(self):
+        """Every rollup row, oldest hour first"""
+        with self._lock:
+            return [row for date in sorted(self.days) for row in self.days[date]]
+
+    def archive(self, transactions, cutoff):
+        """Archive `transactions`, all older than datetime `cutoff`; returns how many were new"""
+        by_day = {}
+        for transaction in transactions:
+            by_day.setdefault(transaction['timestamp'][:10], []).append(transaction)
+        added = 0
+        with self._lock, self._exclusive():
+            # Another worker may have archived since this one last looked
+            self._load()
+            for date, day in sorted(by_day.items()):
+                path = self._day_path(date)
+                archived, intact = self._read_day(path)
+                known = {transaction['id'] for transaction in archived}
+                fresh = [transaction for transaction in day if transaction['id'] not in known]
+                if not intact:
+                    # Members after a damaged one would be unreadable, so start the file over
+                    self._write_day(path, archived + fresh)
+                elif fresh:
+                    self._append_day(path, fresh)
+                added += len(fresh)
+                self.days[date] = rollup_rows(archived + fresh)
+            if self.cutoff is None or cutoff > self.cutoff:
+                self.cutoff = cutoff
+            self._save()
+        logger.info('Archived %d transactions before %s', added, cutoff)
+        return added
+
+    def iter_transactions(self, start=None, end=None):
+        """Yield archived transactions with start <= timestamp < end, oldest day first"""
+        first = start.strftime('%Y-%m-%d %H:%M:%S') if start else ''
+        last = end.strftime('%Y-%m-%d %H:%M:%S') if end else None
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('transactions-') and name.endswith('.ndjson.gz')):
+                continue
+            date = name[len('transactions-'):-len('.ndjson.gz')]
+            if date < first[:10] or (last is not None and date > last[:10]):
+                continue
+            for transaction in self._read_day(os.path.join(self.directory, name))[0]:
+                if transaction['timestamp'] >= first and (last is None or transaction['timestamp'] < last):
+                    yield transaction
+
+    def _day_path(self, date):
+        return os.path.join(self.directory, f'transactions-{date}.ndjson.gz')
+
+    def _read_day(self, path):
+        """(transactions, intact) of one day file"""
+        transactions = []
+        if not os.path.exists(path):
+            return transactions, True
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as handle:
+                for line in handle:
+                    transactions.append(json.loads(line))
+        except (EOFError, OSError, ValueError):
+            # A member cut short by a crash; its transactions are archived again
+            logger.warning('Ignoring incomplete archive data in %s', path)
+            return transactions, False
+        return transactions, True
+
+    def _append_day(self, path, transactions, mode='ab'):
+        data = ''.join(json.dumps(transaction, ensure_ascii=False, separators=(',', ':'),
+                                  default=as_json) + '\n'
+                       for transaction in transactions).encode('utf-8')
+        # Each run appends a new gzip member; readers see the members as one stream
+        with open(path, mode) as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as handle:
+                handle.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def _write_day(self, path, transactions):
+        self._append_day(path + '.tmp', transactions, mode='wb')
+        os.replace(path + '.tmp', path)
+
+    def _load(self):
+        path = os.path.join(self.directory, 'rollups.json')
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as handle:
+            state = json.load(handle)
+        self.cutoff = datetime.fromisoformat(state['cutoff']) if state['cutoff'] else None
+        self.days = state['days']
+
+    def _save(self):
+        path = os.path.join(self.directory, 'rollups.json')
+        state = {'cutoff': self.cutoff.isoformat(sep=' ') if self.cutoff else None, 'days': self.days}
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(state, handle, ensure_ascii=False, separators=(',', ':'))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + '.tmp', path)
+
+    @contextmanager
+    def _exclusive(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,112 @@
+"""Fan-out of live updates to server-sent event (SSE) streams.
+
+Publishing formats an event once and offers it to every subscriber's own
+bounded queue without blocking, so a slow or stalled screen never holds up a
+sale. A subscriber whose queue is full loses its backlog and gets a single
+'resync' event instead, telling the client to reload its state.
+
+Each subscription is consumed by one streaming response through stream(),
+which also sends keep-alive comments so proxies do not close idle streams.
+"""
+import itertools
+import json
+import queue
+import threading
+
+from models import as_json
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+
+
+class Subscription:
+    """One client's bounded queue of formatted events"""
+
+    def __init__(self, topics, size):
+        self.topics = topics  # event names wanted, or None for all
+        self._queue = queue.Queue(size)
+        self._lock = threading.Lock()
+        self.dropped = 0      # events lost to overflow
+
+    def wants(self, event):
+        return self.topics is None or event in self.topics
+
+    def offer(self, message):
+        """Queue a message without waiting; on overflow replace the backlog with a resync"""
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            with self._lock:
+                while True:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        break
+                self._queue.put_nowait(RESYNC)
+
+    def close(self):
+        """End the stream after the queued events"""
+        with self._lock:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                self._queue.get_nowait()
+                self._queue.put_nowait(None)
+
+    def stream(self, keepalive=15, retry_ms=3000):
+        """Yield the SSE text for this subscriber until it is closed"""
+        yield f'retry: {retry_ms}\n\n'
+        while True:
+            try:
+                message = self._queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                return
+            yield message
+
+
+class EventBroker:
+    """Publishes named JSON events to every matching subscription"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, topics=None):
+        """A new subscription to `topics` (an iterable of event names, None for all)"""
+        subscription = Subscription(frozenset(topics) if topics else None, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data):
+        """Send `data` as event `event` to the subscribers that want it"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            subscribers = [subscription for subscription in self._subscribers if subscription.wants(event)]
+        if not subscribers:
+            return
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=as_json)
+        message = f'id: {next(self._ids)}\nevent: {event}\ndata: {payload}\n\n'
+        for subscription in subscribers:
+            subscription.offer(message)
+
+    def close(self):
+        """End every open stream, at shutdown"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.close()
@@ -0,0 +1,91 @@
+"""Streaming CSV and newline-delimited JSON exports.
+
+Rows are produced lazily and encoded in small batches, so an export of any
+size uses constant memory and the first bytes leave before the last row has
+been read. Gzip is applied incrementally with a single zlib compressor.
+"""
+import csv
+import io
+import json
+import zlib
+
+from aggregates import line_profit
+from models import as_json
+
+# Rows encoded per chunk handed to the WSGI server
+BATCH_ROWS = 500
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),  # Response adds the charset to text types
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+TRANSACTION_COLUMNS = ['transaction_id', 'timestamp', 'total', 'profit', 'payment_amount', 'change',
+                       'kode', 'nama', 'harga_jual', 'quantity', 'subtotal', 'line_profit']
+ITEM_COLUMNS = ['id', 'kode', 'nama', 'harga_awal', 'harga_jual', 'stok_awal', 'stok_akhir', 'profit']
+DAILY_SALES_COLUMNS = ['date', 'count', 'total', 'profit']
+
+
+def transaction_line_rows(transactions):
+    """One flat row per transaction line, for CSV"""
+    for transaction in transactions:
+        for line in transaction['items']:
+            yield {
+                'transaction_id': transaction['id'],
+                'timestamp': transaction['timestamp'],
+                'total': transaction['total'],
+                'profit': transaction['profit'],
+                'payment_amount': transaction['payment_amount'],
+                'change': transaction['change'],
+                'kode': line['kode'],
+                'nama': line['nama'],
+                'harga_jual': line['harga_jual'],
+                'quantity': line['quantity'],
+                'subtotal': line['subtotal'],
+                'line_profit': line_profit(line)
+            }
+
+
+def daily_sales_rows(daily_sales, start=None, end=None):
+    """Per-day totals as rows, oldest day first, for days in [start, end)"""
+    first = start.date().isoformat() if start else None
+    stop = end.date().isoformat() if end else None
+    for date, day in daily_sales.items():
+        if (first is None or date >= first) and (stop is None or date < stop):
+            yield dict(date=date, **day)
+
+
+def encode_csv(columns, rows):
+    """Yield a header and the rows as UTF-8 CSV, BATCH_ROWS at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, extrasaction='ignore')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % BATCH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(records):
+    """Yield one JSON object per line, BATCH_ROWS at a time"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=as_json))
+        if len(lines) == BATCH_ROWS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
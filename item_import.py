@@ -0,0 +1,132 @@
+"""Parsing and row validation for bulk catalogue imports.
+
+An upload is a CSV file with a header row, NDJSON (one object per line) or a
+JSON array of objects, with the columns in COLUMNS. CSV and NDJSON are read
+as a stream, one row at a time, so a large price list never has to sit in
+memory as text; a JSON array is decoded whole.
+
+Each row is keyed by kode. A code the catalogue does not know yet is a new
+item and needs nama, harga_awal and harga_jual; stok_tambah is its opening
+stock. A known code updates whichever of nama, harga_awal and harga_jual the
+row fills in and adds stok_tambah (negative for a write-off) to its stock.
+"""
+import codecs
+import csv
+import json
+
+FORMATS = ('csv', 'ndjson', 'json')
+
+COLUMNS = ('kode', 'nama', 'harga_awal', 'harga_jual', 'stok_tambah')
+
+REQUIRED_FOR_NEW = ('nama', 'harga_awal', 'harga_jual')
+
+# Column sizes of the SQL backend
+MAX_KODE_LENGTH = 64
+MAX_NAMA_LENGTH = 255
+
+
+class InvalidFile(Exception):
+    """An upload that cannot be read at all; the message is shown to the admin"""
+
+
+class InvalidRow(Exception):
+    """One row that cannot be imported; the message is shown to the admin"""
+
+
+def detect_format(filename, requested=None):
+    """The upload format from an explicit choice or the file extension"""
+    if requested:
+        file_format = requested.lower()
+    else:
+        file_format = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else 'csv'
+        if file_format == 'jsonl':
+            file_format = 'ndjson'
+    if file_format not in FORMATS:
+        raise InvalidFile(f'Format berkas tidak didukung: {file_format}')
+    return file_format
+
+
+def read_rows(stream, file_format):
+    """Yield (row number, raw row) from a binary upload stream, numbering data rows from 1
+
+    A row that is not an object comes through as None so it can be reported
+    with its number; InvalidFile is raised when the file as a whole is unusable.
+    """
+    text = codecs.getreader('utf-8-sig')(stream)
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            fields = [name.strip() for name in reader.fieldnames or ()]
+            if 'kode' not in fields:
+                raise InvalidFile('Baris judul CSV harus memuat kolom kode')
+            reader.fieldnames = fields
+            for number, row in enumerate(reader, 1):
+                yield number, row
+        elif file_format == 'ndjson':
+            number = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+        else:
+            try:
+                rows = json.load(text)
+            except ValueError:
+                raise InvalidFile('Berkas JSON tidak valid')
+            if not isinstance(rows, list):
+                raise InvalidFile('Berkas JSON harus berisi daftar barang')
+            for number, row in enumerate(rows, 1):
+                yield number, row if isinstance(row, dict) else None
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise InvalidFile(f'Berkas tidak dapat dibaca: {e}')
+
+
+def parse_row(row):
+    """(kode, fields, stock delta) of one raw row; fields holds only the columns filled in"""
+    if row is None:
+        raise InvalidRow('Baris tidak valid')
+    kode = _text(row.get('kode'))
+    if not kode:
+        raise InvalidRow('Kode barang wajib diisi')
+    if len(kode) > MAX_KODE_LENGTH:
+        raise InvalidRow(f'Kode barang maksimal {MAX_KODE_LENGTH} karakter')
+    fields = {}
+    nama = _text(row.get('nama'))
+    if nama:
+        if len(nama) > MAX_NAMA_LENGTH:
+            raise InvalidRow(f'Nama barang maksimal {MAX_NAMA_LENGTH} karakter')
+        fields['nama'] = nama
+    for name in ('harga_awal', 'harga_jual'):
+        value = _integer(row.get(name), name)
+        if value is not None:
+            if value < 0:
+                raise InvalidRow(f'{name} tidak boleh negatif')
+            fields[name] = value
+    stock = _integer(row.get('stok_tambah'), 'stok_tambah')
+    return kode, fields, stock or 0
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _integer(value, name):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise InvalidRow(f'{name} harus berupa bilangan bulat')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise InvalidRow(f'{name} harus berupa bilangan bulat')
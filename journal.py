@@ -0,0 +1,333 @@
+"""Append-only write-ahead journal for the in-memory storage backend.
+
+Every committed sale and item change is appended to a JSON-lines journal
+segment. Appends only write into the file buffer; a background thread
+flushes and fsyncs the segment once per commit window (group commit), so a
+checkout never waits on the disk and a crash loses at most one window of
+writes.
+
+Every `snapshot_every` records the full state is written to a snapshot
+file and a new journal segment is started. On startup the newest snapshot is
+loaded and only the segments written after it are replayed, so recovery
+time is bounded by the snapshot interval rather than the whole history.
+
+Layout of the journal directory:
+
+    snapshot-<seq>.json   state after record <seq>, written atomically
+    journal-<seq>.log     records starting at <seq>, one JSON object per line
+"""
+import json
+import logging
+import os
+import threading
+
+from models import Transaction, as_stored_json
+from storage import TIMESTAMP_FORMAT, MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+
+def _seq_of(filename):
+    return int(filename.split('-', 1)[1].split('.', 1)[0])
+
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Segmented JSON-lines journal with group commit"""
+
+    def __init__(self, directory, commit_window=0.05):
+        self.directory = directory
+        self.commit_window = commit_window
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()       # guards appends and the buffer
+        self._sync_lock = threading.Lock()  # guards fsync and segment rotation
+        self._file = None
+        self._dirty = False
+        self.seq = 0
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def open(self, seq):
+        """Start appending after record `seq` in a fresh segment"""
+        self.seq = seq
+        self._file = self._open_segment(seq + 1)
+        self._flusher = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+        self._flusher.start()
+
+    def append(self, record):
+        """Append one record; it becomes durable within one commit window"""
+        line = json.dumps(record, separators=(',', ':'), default=as_stored_json) + '\n'
+        with self._lock:
+            self.seq += 1
+            self._file.write(line)
+            self._dirty = True
+            return self.seq
+
+    def sync(self):
+        """Flush buffered records and fsync them to disk"""
+        with self._sync_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._file.flush()
+                self._dirty = False
+                fd = self._file.fileno()
+            # Appends continue into the buffer while the disk catches up
+            os.fsync(fd)
+
+    def rotate(self):
+        """Close the current segment and start a new one; returns the last seq"""
+        with self._sync_lock, self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._dirty = False
+            self._file = self._open_segment(self.seq + 1)
+            return self.seq
+
+    def close(self):
+        """Stop the flusher and make every appended record durable"""
+        if self._file is None or self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+    def segments(self, after_seq):
+        """Journal segments that may hold records after `after_seq`, oldest first"""
+        names = sorted((name for name in os.listdir(self.directory)
+                        if name.startswith('journal-') and name.endswith('.log')), key=_seq_of)
+        # A segment is needed if the next one starts at or before after_seq + 1
+        needed = []
+        for position, name in enumerate(names):
+            following = names[position + 1] if position + 1 < len(names) else None
+            if following is None or _seq_of(following) > after_seq + 1:
+                needed.append(name)
+        return needed
+
+    def read(self, after_seq):
+        """Yield (seq, record) for every record after `after_seq`"""
+        for name in self.segments(after_seq):
+            seq = _seq_of(name) - 1
+            path = os.path.join(self.directory, name)
+            complete = 0
+            with open(path, 'rb') as handle:
+                for line in handle:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('record without its newline')
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn write at the tail of the last segment after a crash; cut it off
+                        # so records appended after recovery do not land behind it
+                        logger.warning('Truncating incomplete journal record in %s', name)
+                        self._truncate(path, complete)
+                        break
+                    complete += len(line)
+                    seq += 1
+                    if seq > after_seq:
+                        yield seq, record
+
+    def remove_segments_before(self, seq):
+        """Delete segments whose records all precede `seq`"""
+        names = sorted((name for name in os.listdir(self.directory)
+                        if name.startswith('journal-') and name.endswith('.log')), key=_seq_of)
+        for name, following in zip(names, names[1:]):
+            if _seq_of(following) <= seq + 1:
+                os.remove(os.path.join(self.directory, name))
+
+    def _truncate(self, path, size):
+        with open(path, 'r+b') as handle:
+            handle.truncate(size)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _open_segment(self, first_seq):
+        path = os.path.join(self.directory, f'journal-{first_seq:012d}.log')
+        handle = open(path, 'a', encoding='utf-8')
+        _fsync_directory(self.directory)
+        return handle
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.commit_window):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Journal sync failed')
+
+
+class JournalStorage(MemoryStorage):
+    """In-memory storage made durable by a journal and periodic snapshots
+
+    The backend keeps its own copy of every item and shares the committed
+    transaction dicts with the application, so a snapshot is always taken
+    from a state that matches the journal position exactly.
+    """
+
+    name = 'journal'
+
+    def __init__(self, directory, commit_window=0.05, snapshot_every=10000):
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.journal = Journal(directory, commit_window)
+        self._items = {}
+        self._transactions = []
+        self._records_since_snapshot = 0
+        self._snapshot_thread = None
+        self._recover()
+
+    def load(self, since=None):
+        first = since.strftime(TIMESTAMP_FORMAT) if since is not None else ''
+        with self._lock:
+            transactions = [transaction for transaction in self._transactions
+                            if transaction['timestamp'] >= first]
+            return 0, [dict(item) for item in self._items.values()], transactions
+
+    def insert_item(self, item):
+        item_id, _ = super().insert_item(item)
+        self._write({'op': 'item', 'item': dict(self._fields(item), id=item_id)})
+        return item_id, None
+
+    def save_item(self, item):
+        self._write({'op': 'item', 'item': self._fields(item)})
+        return None
+
+    def delete_item(self, item_id):
+        self._write({'op': 'delete', 'id': item_id})
+        return None
+
+    def import_items(self, new_items, updates):
+        item_ids, _, _ = super().import_items(new_items, updates)
+        self._write({'op': 'import',
+                     'items': [dict(self._fields(item), id=item_id)
+                               for item, item_id in zip(new_items, item_ids)],
+                     'updates': [[item_id, fields, stock] for item_id, fields, stock in updates]})
+        return item_ids, None, None
+
+    def commit_sale(self, transaction, stock_changes):
+        transaction_id, _, _ = super().commit_sale(transaction, stock_changes)
+        transaction['id'] = transaction_id
+        self._write({'op': 'sale', 'transaction': transaction,
+                     'stock': [list(change) for change in stock_changes]})
+        return transaction_id, None, None
+
+    def forget_before(self, cutoff):
+        """Drop archived transactions; the next snapshot no longer carries them"""
+        last = cutoff.strftime(TIMESTAMP_FORMAT)
+        with self._lock:
+            self._transactions = [transaction for transaction in self._transactions
+                                  if transaction['timestamp'] >= last]
+
+    def snapshot(self):
+        """Write a snapshot now and drop the journal segments it covers"""
+        with self._lock:
+            seq = self.journal.rotate()
+            state = {
+                'seq': seq,
+                'next_item_id': self._next_item_id,
+                'next_transaction_id': self._next_transaction_id,
+                'items': [dict(item) for item in self._items.values()],
+                # Committed transactions are never modified, so the records can be shared
+                'transactions': list(self._transactions)
+            }
+            self._records_since_snapshot = 0
+        # Serializing happens outside the lock so sales keep flowing
+        path = os.path.join(self.directory, f'snapshot-{seq:012d}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(state, handle, separators=(',', ':'), default=as_stored_json)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + '.tmp', path)
+        _fsync_directory(self.directory)
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot-') and name.endswith('.json') and _seq_of(name) < seq:
+                os.remove(os.path.join(self.directory, name))
+        self.journal.remove_segments_before(seq)
+        logger.info('Journal snapshot written at record %d', seq)
+
+    def close(self):
+        """Make every journaled record durable"""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.journal.close()
+
+    def _fields(self, item):
+        fields = {key: item[key] for key in
+                  ('id', 'kode', 'nama', 'harga_awal', 'harga_jual', 'stok_awal', 'stok_akhir')
+                  if key in item}
+        # The store is hidden from the item's keys and never changes after insert
+        if item.get('store') is not None:
+            fields['store'] = item.get('store')
+        return fields
+
+    def _write(self, record):
+        with self._lock:
+            self._apply(record)
+            self.journal.append(record)
+            self._records_since_snapshot += 1
+            due = (self._records_since_snapshot >= self.snapshot_every
+                   and (self._snapshot_thread is None or not self._snapshot_thread.is_alive()))
+            if due:
+                self._snapshot_thread = threading.Thread(target=self.snapshot, name='journal-snapshot',
+                                                         daemon=True)
+                self._snapshot_thread.start()
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'item':
+            fields = record['item']
+            item = self._items.setdefault(fields['id'], {})
+            item.update(fields)
+            self._next_item_id = max(self._next_item_id, fields['id'] + 1)
+        elif op == 'import':
+            for fields in record['items']:
+                self._apply({'op': 'item', 'item': fields})
+            for item_id, fields, stock in record['updates']:
+                item = self._items.get(item_id)
+                if item is not None:
+                    item.update(fields)
+                    item['stok_awal'] += stock
+                    item['stok_akhir'] += stock
+        elif op == 'delete':
+            self._items.pop(record['id'], None)
+        elif op == 'sale':
+            # Replayed sales become records too, so the mirror stays compact
+            transaction = record['transaction'] = Transaction.from_dict(record['transaction'])
+            for item_id, quantity in record['stock']:
+                if item_id in self._items:
+                    self._items[item_id]['stok_akhir'] -= quantity
+            self._transactions.append(transaction)
+            self._next_transaction_id = max(self._next_transaction_id, transaction['id'] + 1)
+
+    def _recover(self):
+        seq = 0
+        snapshots = sorted((name for name in os.listdir(self.directory)
+                            if name.startswith('snapshot-') and name.endswith('.json')), key=_seq_of)
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1]), encoding='utf-8') as handle:
+                state = json.load(handle)
+            seq = state['seq']
+            self._items = {item['id']: item for item in state['items']}
+            self._transactions = [Transaction.from_dict(transaction)
+                                  for transaction in state['transactions']]
+            self._next_item_id = state['next_item_id']
+            self._next_transaction_id = state['next_transaction_id']
+        replayed = 0
+        for seq, record in self.journal.read(seq):
+            self._apply(record)
+            replayed += 1
+        self._records_since_snapshot = replayed
+        self.journal.open(seq)
+        logger.info('Journal recovered %d items and %d transactions (%d records replayed)',
+                    len(self._items), len(self._transactions), replayed)
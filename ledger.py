@@ -0,0 +1,220 @@
+"""Columnar ledger of sold lines for report rollups.
+
+Every sold line is appended to a set of typed arrays (transaction id, item,
+quantity, revenue, profit, time) instead of being kept only as nested dicts.
+Per-day, per-item and per-hour revenue and profit are group-bys over those
+columns: vectorized with NumPy when it is installed, plain loops over the
+compact arrays otherwise.
+
+Items are stored as indexes into the ledger's own code table, so lines of
+deleted items and of history loaded from storage keep their identity.
+
+Old lines can be compacted into one row per item and hour. Such a row has
+no transaction id and sums the lines it replaces, including the number of
+transactions they started, so every rollup stays exact.
+
+Rows are kept in time order, so a date range is located by bisecting the
+time column and only the rows inside it are copied, O(log n + k).
+"""
+import importlib.util
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from aggregates import line_profit
+
+# NumPy is only imported by the first report, not when the app starts
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+
+COLUMNS = ('transaction_id', 'item', 'quantity', 'revenue', 'profit', 'time', 'transactions')
+
+
+def _epoch(moment):
+    # Timestamps are local wall-clock time; reading them as UTC keeps day
+    # and hour buckets aligned with the timestamp text
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _date(day):
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m-%d')
+
+
+class SalesLedger:
+    """Append-only columnar record of every sold line"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.codes = []    # item index -> kode
+        self.names = []    # item index -> nama at first sale
+        self._index = {}   # kode -> item index
+        self.transaction_id = array('q')  # 0 on compacted rows
+        self.item = array('l')
+        self.quantity = array('q')
+        self.revenue = array('q')
+        self.profit = array('q')
+        self.time = array('q')            # seconds since the epoch, ascending
+        self.transactions = array('l')    # transactions started by the row: 1 on a first line
+
+    def __len__(self):
+        return len(self.quantity)
+
+    def record(self, transaction):
+        """Append the lines of one committed transaction"""
+        when = _epoch(datetime.fromisoformat(transaction['timestamp']))
+        with self._lock:
+            for position, line in enumerate(transaction['items']):
+                self._append(transaction['id'], self._item_index(line['kode'], line['nama']),
+                             line['quantity'], line['subtotal'], line_profit(line), when,
+                             1 if position == 0 else 0)
+
+    def record_rollup(self, kode, nama, hour, quantity, revenue, profit, transactions):
+        """Append one compacted row for `kode` in the hour starting at datetime `hour`"""
+        with self._lock:
+            self._append(0, self._item_index(kode, nama), quantity, revenue, profit, _epoch(hour),
+                         transactions)
+
+    def compact_before(self, cutoff):
+        """Replace the lines before datetime `cutoff` with one row per item and hour"""
+        limit = _epoch(cutoff)
+        with self._lock:
+            kept = {name: array(getattr(self, name).typecode) for name in COLUMNS}
+            rollups = {}
+            for row in zip(*(getattr(self, name) for name in COLUMNS)):
+                when = row[5]
+                if when >= limit:
+                    for name, value in zip(COLUMNS, row):
+                        kept[name].append(value)
+                    continue
+                key = (when - when % SECONDS_PER_HOUR, row[1])
+                sums = rollups.get(key)
+                if sums is None:
+                    sums = rollups[key] = [0, 0, 0, 0]
+                sums[0] += row[2]
+                sums[1] += row[3]
+                sums[2] += row[4]
+                sums[3] += row[6]
+            # Rollups all precede the kept rows, so they go first to keep time order
+            for name in COLUMNS:
+                setattr(self, name, array(getattr(self, name).typecode))
+            for (hour, item), (quantity, revenue, profit, transactions) in sorted(rollups.items()):
+                self._append(0, item, quantity, revenue, profit, hour, transactions)
+            for name in COLUMNS:
+                getattr(self, name).extend(kept[name])
+
+    def daily(self, start=None, end=None):
+        """{date: {'total', 'profit', 'count'}} for lines in [start, end), oldest day first"""
+        columns = self._columns(start, end)
+        if NUMPY_AVAILABLE:
+            days, _, totals, profits, counts = self._group(columns, columns['time'] // SECONDS_PER_DAY)
+        else:
+            days, _, totals, profits, counts = self._group_loop(
+                columns, (when // SECONDS_PER_DAY for when in columns['time']))
+        return {_date(day): {'total': total, 'profit': profit, 'count': count}
+                for day, total, profit, count in zip(days, totals, profits, counts)}
+
+    def hourly(self, start=None, end=None):
+        """{hour of day: {'total', 'profit', 'count'}} for lines in [start, end)"""
+        columns = self._columns(start, end)
+        if NUMPY_AVAILABLE:
+            hours, _, totals, profits, counts = self._group(
+                columns, columns['time'] // SECONDS_PER_HOUR % 24)
+        else:
+            hours, _, totals, profits, counts = self._group_loop(
+                columns, (when // SECONDS_PER_HOUR % 24 for when in columns['time']))
+        return {hour: {'total': total, 'profit': profit, 'count': count}
+                for hour, total, profit, count in zip(hours, totals, profits, counts)}
+
+    def items(self, start=None, end=None):
+        """{kode: {'nama', 'quantity', 'revenue', 'profit'}} for lines in [start, end)"""
+        columns = self._columns(start, end)
+        if NUMPY_AVAILABLE:
+            groups = self._group(columns, columns['item'])
+        else:
+            groups = self._group_loop(columns, columns['item'])
+        return {self.codes[index]: {'nama': self.names[index], 'quantity': quantity,
+                                    'revenue': revenue, 'profit': profit}
+                for index, quantity, revenue, profit, _ in zip(*groups)}
+
+    def totals(self, start=None, end=None):
+        """Transaction count, revenue, profit and units sold for lines in [start, end)"""
+        columns = self._columns(start, end)
+        # NumPy arrays sum vectorized; the array fallback uses the builtin
+        total = (lambda column: int(column.sum())) if NUMPY_AVAILABLE else sum
+        return {
+            'total_transactions': total(columns['transactions']),
+            'total_revenue': total(columns['revenue']),
+            'total_profit': total(columns['profit']),
+            'total_items_sold': total(columns['quantity'])
+        }
+
+    def top_items(self, n=10, start=None, end=None):
+        """Best selling items as (kode, totals) pairs, most units sold first"""
+        # Item indexes follow first sale, so ties rank by first sale like SalesAggregates
+        ranked = sorted(self.items(start, end).items(), key=lambda pair: pair[1]['quantity'], reverse=True)
+        return ranked[:n]
+
+    def _item_index(self, kode, nama):
+        index = self._index.get(kode)
+        if index is None:
+            index = self._index[kode] = len(self.codes)
+            self.codes.append(kode)
+            self.names.append(nama)
+        return index
+
+    def _append(self, *row):
+        when = row[5]
+        if not self.time or when >= self.time[-1]:
+            for name, value in zip(COLUMNS, row):
+                getattr(self, name).append(value)
+        else:
+            # A late arrival (e.g. synced from another worker) is inserted in place
+            position = bisect_right(self.time, when)
+            for name, value in zip(COLUMNS, row):
+                getattr(self, name).insert(position, value)
+
+    def _columns(self, start, end):
+        """Consistent copies of the columns, restricted to [start, end)"""
+        with self._lock:
+            # The time column is ascending, so the range is two bisections
+            low = 0 if start is None else bisect_left(self.time, _epoch(start))
+            high = len(self.time) if end is None else bisect_left(self.time, _epoch(end))
+            high = max(low, high)
+            columns = {name: getattr(self, name)[low:high] for name in COLUMNS[1:]}
+        if NUMPY_AVAILABLE:
+            import numpy as np
+            # The slices above are private copies, so 64-bit columns are used in place
+            columns = {name: np.frombuffer(column, dtype=column.typecode).astype(np.int64, copy=False)
+                       for name, column in columns.items()}
+        return columns
+
+    def _group(self, columns, keys):
+        """[keys, quantity, revenue, profit, transactions] summed per distinct key"""
+        # Days, hours and item indexes are dense small integers, so bincount
+        # over the offset keys groups them in one pass without sorting
+        import numpy as np
+        if not len(keys):
+            return [[], [], [], [], []]
+        base = int(keys.min())
+        keys = keys - base
+        groups = np.flatnonzero(np.bincount(keys))
+        sums = [np.bincount(keys, weights=columns[name])[groups].astype(np.int64).tolist()
+                for name in ('quantity', 'revenue', 'profit', 'transactions')]
+        return [(groups + base).tolist()] + sums
+
+    def _group_loop(self, columns, keys):
+        totals = {}
+        for key, quantity, revenue, profit, transactions in zip(
+                keys, columns['quantity'], columns['revenue'], columns['profit'], columns['transactions']):
+            sums = totals.get(key)
+            if sums is None:
+                sums = totals[key] = [0, 0, 0, 0]
+            sums[0] += quantity
+            sums[1] += revenue
+            sums[2] += profit
+            sums[3] += transactions
+        groups = sorted(totals)
+        return [groups] + [[totals[key][position] for key in groups] for position in range(4)]
@@ -0,0 +1,46 @@
+"""Per-item locks for atomic checkout.
+
+A sale locks only the items in its basket, always in ascending id order, so
+two tills selling different items never wait on each other and two baskets
+sharing items cannot deadlock.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class ItemLocks:
+    """Lazily created lock per item id"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    def lock_for(self, item_id):
+        """The lock for one item, created on first use"""
+        lock = self._locks.get(item_id)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(item_id, threading.Lock())
+        return lock
+
+    @contextmanager
+    def hold(self, item_ids):
+        """Hold the locks of all given items for the duration of the block"""
+        locks = [self.lock_for(item_id) for item_id in sorted(set(item_ids))]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def discard(self, item_id):
+        """Forget the lock of a deleted item"""
+        with self._guard:
+            self._locks.pop(item_id, None)
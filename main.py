@@ -1,4 +1,12 @@
-from app import app
+def __getattr__(name):
+    # `main:app` for gunicorn, created on first use. Label rendering processes
+    # import this module as __mp_main__ and must not build an application
+    if name == 'app':
+        from app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    from app import app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,222 @@
+"""Request latency, sale and search counters in the Prometheus text format.
+
+Counters and histograms are kept per label combination in plain dicts under
+one lock each, so recording a value costs a dict lookup and an addition.
+Histograms count each value in its own bucket and only make the counts
+cumulative when /metrics is scraped.
+
+Caches already count their own hits and misses (ImageCache, CacheStats), so
+they are registered as objects and read at scrape time rather than counted
+twice. Gauges and the counters other modules keep (Collected) are likewise
+read from functions at scrape time.
+
+Every worker process keeps its own metrics; a scrape sees the worker that
+answered it.
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from a cached search to a large label sheet
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    """Monotonic count per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> count
+
+    def inc(self, amount=1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_values(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Distribution of observed values per combination of label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [count per bucket (+Inf last), sum]
+
+    def observe(self, value, **labels):
+        key = _label_values(self.labelnames, labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][position] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', dict(labels, le=bound), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Gauge:
+    """A value read from a function at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self._function = function
+
+    def samples(self):
+        yield self.name, {}, self._function()
+
+
+class Collected:
+    """A counter or gauge per value of one label, read from a function at scrape time"""
+
+    def __init__(self, name, help, kind, labelname, function):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelname = labelname
+        self._function = function  # returns {label value: value}
+
+    def samples(self):
+        for label, value in self._function().items():
+            yield self.name, {self.labelname: label}, value
+
+
+class CacheStats:
+    """Hit and miss counts of a cache that does not keep its own"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+
+class CacheMetrics:
+    """Hits, misses and hit ratio of named caches with `hits` and `misses` attributes"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.caches = {}  # name -> cache
+
+    def add(self, name, cache):
+        self.caches[name] = cache
+
+    def families(self):
+        caches = list(self.caches.items())
+        yield (f'{self.prefix}_hits_total', 'Cache lookups answered from the cache', 'counter',
+               [(f'{self.prefix}_hits_total', {'cache': name}, cache.hits) for name, cache in caches])
+        yield (f'{self.prefix}_misses_total', 'Cache lookups that had to compute the value', 'counter',
+               [(f'{self.prefix}_misses_total', {'cache': name}, cache.misses) for name, cache in caches])
+        ratios = []
+        for name, cache in caches:
+            lookups = cache.hits + cache.misses
+            ratios.append((f'{self.prefix}_hit_ratio', {'cache': name},
+                           cache.hits / lookups if lookups else 0))
+        yield f'{self.prefix}_hit_ratio', 'Share of cache lookups that were hits', 'gauge', ratios
+
+
+class Registry:
+    """The metrics of one process, rendered for a Prometheus scrape"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, function):
+        return self.register(Gauge(name, help, function))
+
+    def collected(self, name, help, kind, labelname, function):
+        return self.register(Collected(name, help, kind, labelname, function))
+
+    def caches(self, prefix):
+        return self.register(CacheMetrics(prefix))
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            if hasattr(metric, 'families'):
+                families = metric.families()
+            else:
+                families = [(metric.name, metric.help, metric.kind, metric.samples())]
+            for name, help, kind, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for sample, labels, value in samples:
+                    lines.append(f'{sample}{_format_labels(labels)} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _label_values(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(_format_value(value) if name == "le" else value)}"'
+                     for name, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
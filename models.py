@@ -0,0 +1,165 @@
+"""Compact in-memory records for items, transactions and transaction lines.
+
+The records keep their fields in __slots__ instead of a per-instance dict,
+item codes and names are interned so every line of the same item shares one
+string, and a transaction's lines are a tuple rather than a list. They still
+read and write like the dicts they replace (record['kode'], record.get(),
+dict(record), 'profit' in record), so storage backends, templates and the
+report code see the same shape as before.
+
+Serialization goes through to_dict(): jsonify and |tojson use the app's JSON
+provider, and json.dumps callers pass as_json (API shape) or as_stored_json
+(which also keeps the hidden fields, e.g. a line's item id) as `default`.
+"""
+import sys
+
+from aggregates import line_profit
+
+
+class Record:
+    """Slotted record that behaves like a read/write mapping of its fields"""
+
+    __slots__ = ()
+    FIELDS = ()    # public fields, in serialization order
+    HIDDEN = ()    # kept in memory and storage, left out of API responses
+    INTERNED = ()  # string fields shared between records
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        if key in self.INTERNED and isinstance(value, str):
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Record) else other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def keys(self):
+        return self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def update(self, fields=(), **changes):
+        for key, value in dict(fields, **changes).items():
+            self[key] = value
+
+    def to_dict(self, hidden=False):
+        """The fields as a plain dict (nested records too); hidden fields only on request"""
+        names = self.FIELDS + self.HIDDEN if hidden else self.FIELDS
+        return {name: _plain(getattr(self, name), hidden) for name in names}
+
+    @classmethod
+    def from_dict(cls, data):
+        """A record from a dict (or a record, returned as is); missing fields are None"""
+        if isinstance(data, cls):
+            return data
+        record = cls.__new__(cls)
+        for name in record.__slots__:
+            record[name] = data.get(name)
+        return record
+
+
+def _plain(value, hidden):
+    if isinstance(value, Record):
+        return value.to_dict(hidden)
+    if isinstance(value, tuple):
+        return [_plain(entry, hidden) for entry in value]
+    return value
+
+
+class Item(Record):
+    """One catalogue item"""
+
+    FIELDS = ('id', 'kode', 'nama', 'harga_awal', 'harga_jual', 'stok_awal', 'stok_akhir', 'profit')
+    HIDDEN = ('store',)  # id of the store whose inventory it is in
+    __slots__ = FIELDS + HIDDEN
+    INTERNED = ('kode', 'nama')
+
+    @classmethod
+    def from_dict(cls, data):
+        item = super().from_dict(data)
+        if item.profit is None:
+            item.profit = 0
+        return item
+
+
+class Line(Record):
+    """One sold line of a transaction; item_id refers to the item it was sold from"""
+
+    __slots__ = ('kode', 'nama', 'harga_jual', 'quantity', 'subtotal', 'profit', 'item_id')
+    FIELDS = ('kode', 'nama', 'harga_jual', 'quantity', 'subtotal', 'profit')
+    HIDDEN = ('item_id',)
+    INTERNED = ('kode', 'nama')
+    RECEIPT = ('kode', 'nama', 'harga_jual', 'quantity', 'subtotal')  # sent to the till; profit is not
+
+    def __init__(self, item, quantity, subtotal, profit):
+        # Shares the item's (interned) code and name strings
+        self.item_id = item['id']
+        self.kode = item['kode']
+        self.nama = item['nama']
+        self.harga_jual = item['harga_jual']
+        self.quantity = quantity
+        self.subtotal = subtotal
+        self.profit = profit
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        line = super().from_dict(data)
+        # Lines written before profit was recorded per line
+        line.profit = line_profit(data)
+        return line
+
+
+class Transaction(Record):
+    """One committed sale; its lines are a tuple of Line records"""
+
+    __slots__ = ('id', 'timestamp', 'items', 'total', 'profit', 'payment_amount', 'change', 'key', 'store')
+    FIELDS = ('id', 'timestamp', 'items', 'total', 'profit', 'payment_amount', 'change')
+    # Idempotency key of a sale submitted by a till, id of the store it was made in
+    HIDDEN = ('key', 'store')
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        transaction = super().from_dict(data)
+        transaction.items = tuple(Line.from_dict(line) for line in data['items'])
+        return transaction
+
+
+def as_json(value):
+    """json.dumps `default` hook: records as their public dicts"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def as_stored_json(value):
+    """json.dumps `default` hook for storage: records with their hidden fields"""
+    if isinstance(value, Record):
+        return value.to_dict(hidden=True)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
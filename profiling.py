@@ -0,0 +1,86 @@
+"""Sampling profiler for a single request.
+
+A background thread looks at the profiled thread's current stack every
+`interval` seconds (sys._current_frames) and counts each distinct stack, so
+the request runs at full speed apart from the GIL the sampler briefly takes.
+The result is in the collapsed-stack format ("outer;inner;leaf count" per
+line) that flamegraph.pl and speedscope read directly.
+
+Finished profiles are kept in a small LRU by id for the admin to fetch.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class SamplingProfiler:
+    """Samples one thread's stack until stopped"""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()  # collapsed stack -> samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._started = None
+        self.duration = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; safe to call more than once"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        own = os.path.dirname(os.path.abspath(__file__))
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                filename = code.co_filename
+                if filename.startswith(own):
+                    filename = os.path.relpath(filename, own)
+                names.append(f'{code.co_name} ({filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            names.reverse()
+            self._stacks[';'.join(names)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """The samples as collapsed stacks, most sampled first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+
+class ProfileStore:
+    """The newest finished profiles by id"""
+
+    def __init__(self, capacity=20):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()  # id -> profile text, oldest first
+
+    def add(self, description, profiler):
+        profile_id = os.urandom(8).hex()
+        header = (f'# {description}\n# {profiler.samples} samples every {profiler.interval * 1000:g} ms '
+                  f'over {profiler.duration * 1000:.1f} ms\n')
+        with self._lock:
+            self._profiles[profile_id] = header + profiler.collapsed()
+            while len(self._profiles) > self.capacity:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
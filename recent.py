@@ -0,0 +1,70 @@
+"""Bounded window of the most recent transactions for the cashier history.
+
+Each committed transaction is added once, with its unit count computed at
+that moment, and the window's summary totals are adjusted as transactions
+enter and fall out of it. Reading a page walks back from the newest entry
+and stops after one page, so the full history is never copied or scanned.
+"""
+import threading
+from collections import deque
+from itertools import dropwhile, islice
+
+
+class RecentTransactions:
+    """Ring buffer of the newest transactions with running summary totals"""
+
+    def __init__(self, capacity=1000):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=capacity)  # by transaction id, oldest first
+        self.total_items_sold = 0
+        self.total_revenue = 0
+        self.total_profit = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, transaction):
+        """Add a committed transaction, evicting the oldest when full"""
+        # A shallow copy, so the stored transaction itself is never annotated
+        entry = dict(transaction, item_count=sum(line['quantity'] for line in transaction['items']))
+        with self._lock:
+            if len(self._entries) == self._entries.maxlen:
+                self._account(self._entries.popleft(), -1)
+            # Concurrent sales are recorded after their locks are released,
+            # so ids can arrive slightly out of order; keeping the window in
+            # id order keeps cursor pages from repeating or skipping entries
+            position = len(self._entries)
+            while position and self._entries[position - 1]['id'] > entry['id']:
+                position -= 1
+            self._entries.insert(position, entry)
+            self._account(entry, 1)
+
+    def page(self, before=None, limit=50):
+        """Up to `limit` entries older than transaction id `before`, newest first
+
+        Returns (entries, cursor); pass the cursor as `before` to get the next
+        page. The cursor is None when there is nothing older in the window.
+        """
+        with self._lock:
+            newest_first = reversed(self._entries)
+            if before is not None:
+                newest_first = dropwhile(lambda entry: entry['id'] >= before, newest_first)
+            entries = list(islice(newest_first, limit + 1))
+        if len(entries) > limit:
+            return entries[:limit], entries[limit - 1]['id']
+        return entries, None
+
+    def summary(self):
+        """Totals over the transactions currently in the window"""
+        with self._lock:
+            return {
+                'total_transactions': len(self._entries),
+                'total_items_sold': self.total_items_sold,
+                'total_revenue': self.total_revenue,
+                'total_profit': self.total_profit
+            }
+
+    def _account(self, entry, sign):
+        self.total_items_sold += sign * entry['item_count']
+        self.total_revenue += sign * entry['total']
+        self.total_profit += sign * entry['profit']
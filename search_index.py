@@ -0,0 +1,148 @@
+"""In-memory search index for the cashier item search.
+
+Item codes and names are lowercased once, when an item is added or edited,
+and every substring of up to three characters is posted to an inverted index.
+A query of up to three characters is a single posting lookup; longer queries
+intersect the postings of their trigrams and verify the survivors against the
+stored keys, so the result set matches the old `query in kode/nama` scan.
+"""
+import heapq
+import threading
+from collections import defaultdict
+
+GRAM_SIZE = 3
+
+
+def normalize(text):
+    """Normalize text the same way for items and queries"""
+    return (text or '').strip().lower()
+
+
+def grams(text):
+    """All substrings of `text` up to GRAM_SIZE characters long"""
+    result = set()
+    for size in range(1, GRAM_SIZE + 1):
+        for start in range(len(text) - size + 1):
+            result.add(text[start:start + size])
+    return result
+
+
+class SearchIndex:
+    """N-gram postings over item code and name with an in-stock filter"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}                  # item id -> item
+        self._keys = {}                   # item id -> (kode, nama) normalized
+        self._postings = defaultdict(set)  # gram -> item ids
+        self._in_stock = set()            # item ids with stok_akhir > 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        """Index a new item"""
+        with self._lock:
+            self._add(item)
+
+    def update(self, item):
+        """Re-index an item after its code, name or stock changed"""
+        with self._lock:
+            keys = (normalize(item['kode']), normalize(item['nama']))
+            if self._keys.get(item['id']) != keys:
+                self._remove(item['id'])
+                self._add(item)
+            else:
+                self._items[item['id']] = item
+                self._set_stock(item)
+
+    def update_stock(self, item):
+        """Refresh only the in-stock filter for an item"""
+        with self._lock:
+            if item['id'] in self._items:
+                self._set_stock(item)
+
+    def remove(self, item_id):
+        """Drop an item from the index"""
+        with self._lock:
+            self._remove(item_id)
+
+    def clear(self):
+        """Drop every item from the index"""
+        with self._lock:
+            self._items.clear()
+            self._keys.clear()
+            self._postings.clear()
+            self._in_stock.clear()
+
+    def search(self, query, limit=20, in_stock_only=True):
+        """Return up to `limit` matching items, best matches first"""
+        query = normalize(query)
+        with self._lock:
+            candidates = self._candidates(query)
+            if in_stock_only:
+                candidates &= self._in_stock
+            ranked = [(self._rank(query, item_id), item_id) for item_id in candidates
+                      if self._matches(query, item_id)]
+            best = heapq.nsmallest(limit, ranked)
+            return [self._items[item_id] for _, item_id in best]
+
+    def _add(self, item):
+        item_id = item['id']
+        kode, nama = normalize(item['kode']), normalize(item['nama'])
+        self._items[item_id] = item
+        self._keys[item_id] = (kode, nama)
+        for gram in grams(kode) | grams(nama):
+            self._postings[gram].add(item_id)
+        self._set_stock(item)
+
+    def _remove(self, item_id):
+        keys = self._keys.pop(item_id, None)
+        self._items.pop(item_id, None)
+        self._in_stock.discard(item_id)
+        if keys is None:
+            return
+        for gram in grams(keys[0]) | grams(keys[1]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def _set_stock(self, item):
+        if item['stok_akhir'] > 0:
+            self._in_stock.add(item['id'])
+        else:
+            self._in_stock.discard(item['id'])
+
+    def _candidates(self, query):
+        if not query:
+            return set(self._items)
+        if len(query) <= GRAM_SIZE:
+            return set(self._postings.get(query, ()))
+        trigrams = sorted((self._postings.get(query[i:i + GRAM_SIZE], set())
+                           for i in range(len(query) - GRAM_SIZE + 1)), key=len)
+        return set.intersection(*trigrams) if trigrams[0] else set()
+
+    def _matches(self, query, item_id):
+        if len(query) <= GRAM_SIZE:
+            return True  # the posting itself is an exact substring match
+        kode, nama = self._keys[item_id]
+        return query in kode or query in nama
+
+    def _rank(self, query, item_id):
+        kode, nama = self._keys[item_id]
+        if kode == query:
+            score = 0
+        elif kode.startswith(query):
+            score = 1
+        elif nama.startswith(query):
+            score = 2
+        elif f' {query}' in nama:
+            score = 3
+        elif query in kode:
+            score = 4
+        else:
+            score = 5
+        # Code matches are listed in code order, name matches alphabetically
+        return (score, kode, nama) if score <= 1 else (score, nama, kode)
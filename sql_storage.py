@@ -0,0 +1,366 @@
+"""SQL storage backend: items and transactions in a database via Flask-SQLAlchemy.
+
+Stock is decremented with a conditional UPDATE in the same database
+transaction that records the sale, so several worker processes can sell from
+the same catalogue without overselling. Every write bumps a data version;
+workers compare it on each request and pull only the rows changed since the
+version they last saw.
+
+Imported by storage.create_storage only when DATABASE_URL is set.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import ForeignKey, Index, String, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+
+from aggregates import line_profit
+from storage import TIMESTAMP_FORMAT, DuplicateSale, InsufficientStock
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base)
+
+
+class ItemRow(db.Model):
+    __tablename__ = 'items'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kode: Mapped[str] = mapped_column(String(64), index=True)
+    nama: Mapped[str] = mapped_column(String(255))
+    harga_awal: Mapped[int]
+    harga_jual: Mapped[int]
+    stok_awal: Mapped[int]
+    stok_akhir: Mapped[int]
+    store_id: Mapped[str | None] = mapped_column(String(32))  # None: written before stores, the default one
+    version: Mapped[int] = mapped_column(index=True, default=0)
+    deleted: Mapped[bool] = mapped_column(default=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kode': self.kode,
+            'nama': self.nama,
+            'harga_awal': self.harga_awal,
+            'harga_jual': self.harga_jual,
+            'stok_awal': self.stok_awal,
+            'stok_akhir': self.stok_akhir,
+            'store': self.store_id
+        }
+
+
+class TransactionRow(db.Model):
+    __tablename__ = 'transactions'
+    __table_args__ = (Index('ix_transactions_version', 'version'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    timestamp: Mapped[datetime] = mapped_column(index=True)
+    total: Mapped[int]
+    profit: Mapped[int]
+    payment_amount: Mapped[int]
+    change: Mapped[int]
+    store_id: Mapped[str | None] = mapped_column(String(32))  # None: written before stores, the default one
+    version: Mapped[int] = mapped_column(default=0)
+    lines: Mapped[list['TransactionLineRow']] = relationship(
+        order_by='TransactionLineRow.id', lazy='selectin')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp.strftime(TIMESTAMP_FORMAT),
+            'items': [line.to_dict() for line in self.lines],
+            'total': self.total,
+            'profit': self.profit,
+            'payment_amount': self.payment_amount,
+            'change': self.change,
+            'store': self.store_id
+        }
+
+
+class TransactionLineRow(db.Model):
+    __tablename__ = 'transaction_lines'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    transaction_id: Mapped[int] = mapped_column(ForeignKey('transactions.id'), index=True)
+    item_id: Mapped[int | None]
+    kode: Mapped[str] = mapped_column(String(64))
+    nama: Mapped[str] = mapped_column(String(255))
+    harga_jual: Mapped[int]
+    quantity: Mapped[int]
+    subtotal: Mapped[int]
+    profit: Mapped[int]
+
+    def to_dict(self):
+        return {
+            'kode': self.kode,
+            'nama': self.nama,
+            'harga_jual': self.harga_jual,
+            'quantity': self.quantity,
+            'subtotal': self.subtotal,
+            'profit': self.profit,
+            'item_id': self.item_id
+        }
+
+
+class SaleKeyRow(db.Model):
+    """Idempotency key of a sale submitted by a till, so a retried submit is not sold twice"""
+    __tablename__ = 'sale_keys'
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    transaction_id: Mapped[int] = mapped_column(ForeignKey('transactions.id'))
+
+
+# Columns added after the first release, created on tables that predate them
+ADDED_COLUMNS = (('items', 'store_id', 'VARCHAR(32)'), ('transactions', 'store_id', 'VARCHAR(32)'))
+
+
+class MetaRow(db.Model):
+    __tablename__ = 'meta'
+
+    key: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[int]
+
+
+class SQLStorage:
+    """Write-through storage in a SQL database via Flask-SQLAlchemy"""
+
+    name = 'sql'
+    shared = True
+
+    def __init__(self, app, database_url):
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {'pool_pre_ping': True})
+        if database_url.startswith('sqlite'):
+            # Wait for other workers' write locks instead of failing at once
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('connect_args', {'timeout': 30})
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            self._add_columns()
+            if database_url.startswith('sqlite'):
+                with db.engine.connect() as connection:
+                    connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+            if db.session.get(MetaRow, 'version') is None:
+                db.session.add(MetaRow(key='version', value=0))
+                db.session.commit()
+
+    def _add_columns(self):
+        inspector = inspect(db.engine)
+        for table, column, column_type in ADDED_COLUMNS:
+            if column not in {existing['name'] for existing in inspector.get_columns(table)}:
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def load(self, since=None):
+        """Data version, items and transactions (from datetime `since` on), read from one snapshot"""
+        version = db.session.scalar(select(MetaRow.value).where(MetaRow.key == 'version'))
+        items = [row.to_dict() for row in db.session.scalars(
+            select(ItemRow).where(ItemRow.deleted.is_(False)).order_by(ItemRow.id))]
+        query = select(TransactionRow).order_by(TransactionRow.id)
+        if since is not None:
+            query = query.where(TransactionRow.timestamp >= since)
+        transactions = [row.to_dict() for row in db.session.scalars(query)]
+        db.session.commit()
+        return version, items, transactions
+
+    def version(self):
+        version = db.session.scalar(select(MetaRow.value).where(MetaRow.key == 'version'))
+        # End the read transaction so a later write does not start from a stale snapshot
+        db.session.commit()
+        return version
+
+    def changes_since(self, version):
+        """Items and transactions written after `version`, plus the current version"""
+        current = db.session.scalar(select(MetaRow.value).where(MetaRow.key == 'version'))
+        items = [(row.id, None if row.deleted else row.to_dict()) for row in
+                 db.session.scalars(select(ItemRow).where(ItemRow.version > version)
+                                    .order_by(ItemRow.version))]
+        transactions = [(row.version, row.to_dict()) for row in
+                        db.session.scalars(select(TransactionRow).where(TransactionRow.version > version)
+                                           .order_by(TransactionRow.id))]
+        db.session.commit()
+        return current, items, transactions
+
+    def insert_item(self, item):
+        with self._write() as version:
+            row = ItemRow(kode=item['kode'], nama=item['nama'], harga_awal=item['harga_awal'],
+                          harga_jual=item['harga_jual'], stok_awal=item['stok_awal'],
+                          stok_akhir=item['stok_akhir'], store_id=item.get('store'), version=version)
+            if item.get('id'):
+                row.id = item['id']
+            db.session.add(row)
+            db.session.flush()
+            item_id = row.id
+        return item_id, version
+
+    def save_item(self, item):
+        with self._write() as version:
+            db.session.execute(update(ItemRow).where(ItemRow.id == item['id']).values(
+                kode=item['kode'], nama=item['nama'], harga_awal=item['harga_awal'],
+                harga_jual=item['harga_jual'], stok_awal=item['stok_awal'],
+                stok_akhir=item['stok_akhir'], version=version))
+        return version
+
+    def import_items(self, new_items, updates):
+        """Insert and update the whole batch in one database transaction
+
+        An update whose stock delta would take stok_akhir below zero (another
+        worker sold the stock meanwhile) is skipped and missing from the
+        returned stock levels.
+        """
+        with self._write() as version:
+            rows = []
+            for item in new_items:
+                row = ItemRow(kode=item['kode'], nama=item['nama'], harga_awal=item['harga_awal'],
+                              harga_jual=item['harga_jual'], stok_awal=item['stok_awal'],
+                              stok_akhir=item['stok_akhir'], store_id=item.get('store'), version=version)
+                if item.get('id'):
+                    row.id = item['id']
+                rows.append(row)
+            db.session.add_all(rows)
+            db.session.flush()
+            item_ids = [row.id for row in rows]
+            updated = []
+            for item_id, fields, stock in updates:
+                result = db.session.execute(
+                    update(ItemRow)
+                    .where(ItemRow.id == item_id, ItemRow.deleted.is_(False),
+                           ItemRow.stok_akhir + stock >= 0)
+                    .values(stok_awal=ItemRow.stok_awal + stock, stok_akhir=ItemRow.stok_akhir + stock,
+                            version=version, **fields))
+                if result.rowcount == 1:
+                    updated.append(item_id)
+            stock_levels = {}
+            for start in range(0, len(updated), 500):
+                levels = db.session.execute(select(ItemRow.id, ItemRow.stok_awal, ItemRow.stok_akhir)
+                                            .where(ItemRow.id.in_(updated[start:start + 500])))
+                stock_levels.update((item_id, (stok_awal, stok_akhir))
+                                    for item_id, stok_awal, stok_akhir in levels)
+        return item_ids, stock_levels, version
+
+    def delete_item(self, item_id):
+        # Rows are kept as tombstones so other workers see the deletion
+        with self._write() as version:
+            db.session.execute(update(ItemRow).where(ItemRow.id == item_id)
+                               .values(deleted=True, version=version))
+        return version
+
+    def commit_sale(self, transaction, stock_changes):
+        """Decrement stock and record the sale in one database transaction
+
+        Returns the new transaction id, the resulting stock level of every
+        item sold and the data version. Raises InsufficientStock, with
+        nothing written, if any line cannot be fulfilled, and DuplicateSale
+        if another process already committed the sale's idempotency key.
+        """
+        try:
+            with self._write() as version:
+                transaction_id = self._insert_sale(transaction, stock_changes, version)
+                item_ids = [item_id for item_id, _ in stock_changes]
+                stock = dict(db.session.execute(
+                    select(ItemRow.id, ItemRow.stok_akhir).where(ItemRow.id.in_(item_ids))).all())
+        except IntegrityError:
+            # The sale_keys primary key refused a key committed in the meantime
+            existing = self.find_sales([transaction['key']]) if transaction.get('key') else {}
+            if transaction.get('key') not in existing:
+                raise
+            raise DuplicateSale(existing[transaction['key']]) from None
+        return transaction_id, stock, version
+
+    def commit_sales(self, sales):
+        """Record the whole batch in one database transaction
+
+        A sale refused for stock or an already used idempotency key leaves
+        no trace; the others commit together.
+        """
+        outcomes = []
+        item_ids = set()
+        with self._write() as version:
+            for transaction, stock_changes in sales:
+                key = transaction.get('key')
+                existing = db.session.get(SaleKeyRow, key) if key else None
+                if existing is not None:
+                    outcomes.append(DuplicateSale(existing.transaction_id))
+                    continue
+                try:
+                    outcomes.append(self._insert_sale(transaction, stock_changes, version))
+                except InsufficientStock as e:
+                    outcomes.append(e)
+                    continue
+                item_ids.update(item_id for item_id, _ in stock_changes)
+            stock = dict(db.session.execute(
+                select(ItemRow.id, ItemRow.stok_akhir).where(ItemRow.id.in_(item_ids))).all())
+        return outcomes, stock, version
+
+    def find_sales(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            found.update(db.session.execute(select(SaleKeyRow.key, SaleKeyRow.transaction_id)
+                                            .where(SaleKeyRow.key.in_(keys[start:start + 500]))).all())
+        db.session.commit()
+        return found
+
+    def forget_before(self, cutoff):
+        """Archived rows stay in the database, which is the permanent record"""
+        return None
+
+    def _insert_sale(self, transaction, stock_changes, version):
+        """Take the stock and add the sale rows; raises InsufficientStock with the stock restored"""
+        taken = []
+        for item_id, quantity in stock_changes:
+            result = db.session.execute(
+                update(ItemRow)
+                .where(ItemRow.id == item_id, ItemRow.deleted.is_(False),
+                       ItemRow.stok_akhir >= quantity)
+                .values(stok_akhir=ItemRow.stok_akhir - quantity, version=version))
+            if result.rowcount != 1:
+                # Put back what earlier lines took, so the rest of a batch can go on
+                for taken_id, taken_quantity in taken:
+                    db.session.execute(update(ItemRow).where(ItemRow.id == taken_id)
+                                       .values(stok_akhir=ItemRow.stok_akhir + taken_quantity))
+                raise InsufficientStock(item_id)
+            taken.append((item_id, quantity))
+
+        row = TransactionRow(
+            timestamp=datetime.strptime(transaction['timestamp'], TIMESTAMP_FORMAT),
+            total=transaction['total'], profit=transaction['profit'],
+            payment_amount=transaction['payment_amount'], change=transaction['change'],
+            store_id=transaction.get('store'), version=version)
+        if transaction.get('id'):
+            row.id = transaction['id']
+        db.session.add(row)
+        db.session.flush()
+        item_ids = [item_id for item_id, _ in stock_changes]
+        for position, line in enumerate(transaction['items']):
+            db.session.add(TransactionLineRow(
+                transaction_id=row.id,
+                item_id=item_ids[position] if position < len(item_ids) else None,
+                kode=line['kode'], nama=line['nama'], harga_jual=line['harga_jual'],
+                quantity=line['quantity'], subtotal=line['subtotal'],
+                profit=line_profit(line)))
+        if transaction.get('key'):
+            db.session.add(SaleKeyRow(key=transaction['key'], transaction_id=row.id))
+        return row.id
+
+    @contextmanager
+    def _write(self):
+        """Bump the data version, then commit or roll back the whole block"""
+        # Taking the write lock first keeps SQLite from deadlocking on upgrade
+        db.session.execute(update(MetaRow).where(MetaRow.key == 'version')
+                           .values(value=MetaRow.value + 1))
+        version = db.session.scalar(select(MetaRow.value).where(MetaRow.key == 'version'))
+        try:
+            yield version
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+
+    def close(self):
+        return None
@@ -1,7 +1,23 @@
 class POSSystem {
     constructor() {
+        // The store's URLs; its saved sales and catalogue are kept apart from other stores'
+        const pos = document.getElementById('pos').dataset;
+        this.urls = {
+            search: pos.searchUrl,
+            catalogue: pos.catalogueUrl,
+            sale: pos.saleUrl,
+            sales: pos.salesUrl,
+            events: pos.eventsUrl
+        };
+        const suffix = pos.store ? `.${pos.store}` : '';
         this.cart = [];
         this.searchTimeout = null;
+        this.searchLimit = 50;
+        this.pendingSalesKey = `kasir.pendingSales${suffix}`;
+        this.flushing = false;
+        this.catalogueKey = `kasir.catalogue${suffix}`;
+        this.catalogue = new Map();  // item id -> item
+        this.catalogueVersion = null;
         this.init();
     }
 
@@ -9,6 +25,17 @@ class POSSystem {
         console.log('POSSystem initializing...');
         this.setupEventListeners();
         this.updateCartDisplay();
+
+        // Sales recorded while offline are sent as one batch once the server is reachable
+        window.addEventListener('online', () => this.flushPendingSales());
+        setInterval(() => this.flushPendingSales(), 30000);
+        this.flushPendingSales();
+
+        // Keep a local copy of the catalogue for searching without a round trip
+        this.loadCatalogue();
+        setInterval(() => this.syncCatalogue(), 30000);
+        this.syncCatalogue();
+        this.listenForStock();
         console.log('POSSystem initialized successfully');
     }
 
@@ -114,8 +141,13 @@ class POSSystem {
         }
 
         try {
-            const response = await fetch(`/cashier/search_item?q=${encodeURIComponent(query)}`);
-            const items = await response.json();
+            let items;
+            if (this.catalogueVersion) {
+                items = this.searchCatalogue(query);
+            } else {
+                const response = await fetch(`${this.urls.search}?q=${encodeURIComponent(query)}&limit=${this.searchLimit}`);
+                items = await response.json();
+            }
 
             allItems.style.display = 'none';
             
@@ -165,6 +197,121 @@ class POSSystem {
         }
     }
 
+    loadCatalogue() {
+        try {
+            const saved = JSON.parse(localStorage.getItem(this.catalogueKey) || 'null');
+            if (saved) {
+                this.catalogue = new Map(saved.items.map(item => [item.id, item]));
+                this.catalogueVersion = saved.version;
+            }
+        } catch (error) {
+            console.warn('Ignoring saved catalogue:', error);
+        }
+    }
+
+    async syncCatalogue() {
+        try {
+            const headers = {};
+            let url = this.urls.catalogue;
+            if (this.catalogueVersion) {
+                url += `?since=${encodeURIComponent(this.catalogueVersion)}`;
+                headers['If-None-Match'] = `"catalogue-${this.catalogueVersion}"`;
+            }
+            const response = await fetch(url, {headers: headers, cache: 'no-store'});
+            if (response.status === 304 || !response.ok) {
+                return;
+            }
+            const data = await response.json();
+            if (data.full) {
+                this.catalogue.clear();
+            }
+            for (const item of data.items) {
+                this.catalogue.set(item.id, item);
+            }
+            for (const itemId of data.deleted) {
+                this.catalogue.delete(itemId);
+            }
+            this.catalogueVersion = data.version;
+            try {
+                localStorage.setItem(this.catalogueKey, JSON.stringify({
+                    version: this.catalogueVersion,
+                    items: Array.from(this.catalogue.values())
+                }));
+            } catch (error) {
+                // Storage full: the copy in memory still serves this page
+                console.warn('Catalogue not saved locally:', error);
+            }
+        } catch (error) {
+            console.error('Error syncing catalogue:', error);
+        }
+    }
+
+    listenForStock() {
+        // Stock moved by other tills and the admin shows up without polling;
+        // without live events the periodic catalogue sync keeps it current
+        if (!window.EventSource || !this.urls.events) {
+            return;
+        }
+        const events = new EventSource(this.urls.events);
+        events.addEventListener('stock', (event) => {
+            const change = JSON.parse(event.data);
+            const item = this.catalogue.get(change.id);
+            if (change.deleted) {
+                this.catalogue.delete(change.id);
+            } else if (item) {
+                item.stok_akhir = change.stok_akhir;
+            }
+            document.querySelectorAll('.item-card').forEach(card => {
+                const cardItem = JSON.parse(card.dataset.item);
+                if (cardItem.id !== change.id) {
+                    return;
+                }
+                cardItem.stok_akhir = change.stok_akhir;
+                card.dataset.item = JSON.stringify(cardItem);
+                const badge = card.querySelector('.badge');
+                if (badge) {
+                    badge.textContent = change.deleted ? 0 : change.stok_akhir;
+                }
+            });
+        });
+        // Missed updates: fetch whatever changed from the catalogue
+        events.addEventListener('resync', () => this.syncCatalogue());
+    }
+
+    searchCatalogue(query) {
+        // Same matching and ranking as the server's search index
+        const needle = query.trim().toLowerCase();
+        const ranked = [];
+        for (const item of this.catalogue.values()) {
+            if (item.stok_akhir <= 0) {
+                continue;
+            }
+            const kode = item.kode.toLowerCase();
+            const nama = item.nama.toLowerCase();
+            let score;
+            if (kode === needle) {
+                score = 0;
+            } else if (kode.startsWith(needle)) {
+                score = 1;
+            } else if (nama.startsWith(needle)) {
+                score = 2;
+            } else if (nama.includes(` ${needle}`)) {
+                score = 3;
+            } else if (kode.includes(needle)) {
+                score = 4;
+            } else if (nama.includes(needle)) {
+                score = 5;
+            } else {
+                continue;
+            }
+            // Code matches are listed in code order, name matches alphabetically
+            ranked.push([score, score <= 1 ? kode : nama, score <= 1 ? nama : kode, item]);
+        }
+        ranked.sort((a, b) => a[0] - b[0] || (a[1] < b[1] ? -1 : a[1] > b[1] ? 1 : 0) ||
+            (a[2] < b[2] ? -1 : a[2] > b[2] ? 1 : 0));
+        return ranked.slice(0, this.searchLimit).map(entry => entry[3]);
+    }
+
     addToCart(item) {
         const existingItem = this.cart.find(cartItem => cartItem.kode === item.kode);
 
@@ -380,17 +527,39 @@ class POSSystem {
         processBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Memproses...';
         processBtn.disabled = true;
 
+        // The key lets the server recognise this sale if it is sent again
+        const sale = {
+            key: this.newSaleKey(),
+            items: this.cart.map(item => ({kode: item.kode, quantity: item.quantity})),
+            payment_amount: paymentAmount,
+            timestamp: this.localTimestamp()
+        };
+
         try {
-            const response = await fetch('/cashier/process_sale', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    items: this.cart,
-                    payment_amount: paymentAmount
-                })
-            });
+            let response;
+            try {
+                response = await fetch(this.urls.sale, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        key: sale.key,
+                        items: sale.items,
+                        payment_amount: paymentAmount
+                    })
+                });
+            } catch (error) {
+                // No connection: keep the sale on this till and send it later
+                console.error('Error sending sale, queued for later:', error);
+                this.queuePendingSale(sale);
+                this.cart = [];
+                this.updateCartDisplay();
+                document.getElementById('paymentAmount').value = '';
+                this.calculateChange();
+                this.showNotification('Koneksi terputus. Transaksi disimpan dan akan dikirim otomatis.', 'warning');
+                return;
+            }
 
             const result = await response.json();
 
@@ -405,6 +574,7 @@ class POSSystem {
                 this.calculateChange();
                 
                 this.showNotification('Transaksi berhasil!', 'success');
+                this.syncCatalogue();
             } else {
                 this.showNotification(result.message || 'Terjadi kesalahan!', 'error');
             }
@@ -419,6 +589,80 @@ class POSSystem {
         }
     }
 
+    newSaleKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    localTimestamp() {
+        const now = new Date();
+        const pad = (value) => String(value).padStart(2, '0');
+        return `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())} ` +
+            `${pad(now.getHours())}:${pad(now.getMinutes())}:${pad(now.getSeconds())}`;
+    }
+
+    pendingSales() {
+        try {
+            return JSON.parse(localStorage.getItem(this.pendingSalesKey) || '[]');
+        } catch (error) {
+            return [];
+        }
+    }
+
+    queuePendingSale(sale) {
+        const pending = this.pendingSales();
+        pending.push(sale);
+        localStorage.setItem(this.pendingSalesKey, JSON.stringify(pending));
+    }
+
+    async flushPendingSales() {
+        const pending = this.pendingSales();
+        if (this.flushing || pending.length === 0 || !navigator.onLine) {
+            return;
+        }
+        this.flushing = true;
+        try {
+            const batch = pending.slice(0, 100);
+            const response = await fetch(this.urls.sales, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({sales: batch})
+            });
+            const result = await response.json();
+            if (!result.success) {
+                return;
+            }
+
+            // Every sale got an answer; only a rejected one needs the cashier's attention.
+            // A pending one is still being committed by an earlier request, so it stays queued
+            const answered = new Set(result.results.filter(entry => entry.status !== 'pending')
+                .map(entry => entry.key));
+            const rejected = result.results.filter(entry => entry.status === 'rejected');
+            const remaining = this.pendingSales().filter(sale => !answered.has(sale.key));
+            localStorage.setItem(this.pendingSalesKey, JSON.stringify(remaining));
+            if (result.created) {
+                this.showNotification(`${result.created} transaksi offline berhasil dikirim.`, 'success');
+                this.syncCatalogue();
+            }
+            for (const entry of rejected) {
+                this.showNotification(`Transaksi offline ditolak: ${entry.message}`, 'error');
+            }
+            if (remaining.length && answered.size) {
+                this.flushing = false;
+                await this.flushPendingSales();
+            }
+        } catch (error) {
+            // Still offline; the sales stay queued for the next attempt
+            console.error('Error sending queued sales:', error);
+        } finally {
+            this.flushing = false;
+        }
+    }
+
     showSuccessModal(result) {
         const modal = new bootstrap.Modal(document.getElementById('successModal'));
         
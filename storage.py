@@ -0,0 +1,131 @@
+"""Pluggable storage backends for items and transactions.
+
+The application always works on its in-memory dicts and indexes; a storage
+backend is where those changes are written through to. Three backends ship:
+
+- MemoryStorage keeps nothing outside the process and is the default. It is
+  what the sample data and tests run against.
+- JournalStorage (journal.py) is MemoryStorage made durable by an
+  append-only journal and periodic snapshots, for single-process servers.
+- SQLStorage (sql_storage.py) writes to a database through
+  Flask-SQLAlchemy (SQLite or any other SQLAlchemy URL). Stock is
+  decremented with a conditional UPDATE in the same database transaction
+  that records the sale, so several worker processes can sell from the same
+  catalogue without overselling. Every write bumps a data version; workers
+  compare it on each request and pull only the rows changed since the
+  version they last saw.
+"""
+import threading
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class InsufficientStock(Exception):
+    """Raised when a sale asks for more units than an item has left"""
+
+    def __init__(self, item_id):
+        super().__init__(f'Insufficient stock for item {item_id}')
+        self.item_id = item_id
+
+
+class DuplicateSale(Exception):
+    """A sale whose idempotency key was already committed, as transaction_id"""
+
+    def __init__(self, transaction_id):
+        super().__init__(f'Sale already recorded as transaction {transaction_id}')
+        self.transaction_id = transaction_id
+
+
+class MemoryStorage:
+    """No persistence: the in-memory dicts are the only copy of the data"""
+
+    name = 'memory'
+    shared = False  # whether other worker processes write to the same data
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_item_id = 1
+        self._next_transaction_id = 1
+
+    def load(self, since=None):
+        """Data version, items and transactions (from datetime `since` on) to start from"""
+        return 0, [], []
+
+    def version(self):
+        """Data version shared by all processes; constant without a database"""
+        return 0
+
+    def changes_since(self, version):
+        return 0, [], []
+
+    def insert_item(self, item):
+        """Assign an id to a new item (keeping an explicit one) and store it"""
+        return self._assign_item_id(item), None
+
+    def save_item(self, item):
+        return None
+
+    def delete_item(self, item_id):
+        return None
+
+    def import_items(self, new_items, updates):
+        """Store a batch of new items and item updates as one write
+
+        `updates` holds (item id, changed fields, stock delta) triples; the
+        delta is added to both stok_awal and stok_akhir. Returns the ids of
+        the new items, the resulting (stok_awal, stok_akhir) of every item
+        updated (None when the caller applies the deltas itself, as here) and
+        the data version.
+        """
+        return [self._assign_item_id(item) for item in new_items], None, None
+
+    def commit_sale(self, transaction, stock_changes):
+        """Assign a transaction id; stock is checked by the caller in memory"""
+        with self._lock:
+            transaction_id = transaction.get('id') or self._next_transaction_id
+            self._next_transaction_id = max(self._next_transaction_id, transaction_id + 1)
+        return transaction_id, None, None
+
+    def commit_sales(self, sales):
+        """Commit a batch of (transaction, stock changes) pairs in one write
+
+        Sales are committed in order and each one independently. Returns one
+        outcome per sale (its transaction id, or the InsufficientStock or
+        DuplicateSale that refused it), the stock level after the batch of
+        every item sold (None when the caller tracks stock, as here) and the
+        data version. Idempotency keys are checked by the caller in memory.
+        """
+        return [self.commit_sale(transaction, stock_changes)[0]
+                for transaction, stock_changes in sales], None, None
+
+    def find_sales(self, keys):
+        """{idempotency key: transaction id} of the given keys already committed by another process"""
+        return {}
+
+    def forget_before(self, cutoff):
+        """Release transactions before datetime `cutoff` that have been archived"""
+        return None
+
+    def close(self):
+        """Release resources at shutdown"""
+        return None
+
+    def _assign_item_id(self, item):
+        with self._lock:
+            item_id = item.get('id') or self._next_item_id
+            self._next_item_id = max(self._next_item_id, item_id + 1)
+        return item_id
+
+
+def create_storage(app, database_url=None, journal_dir=None, commit_window=0.05, snapshot_every=10000):
+    """Pick a backend: SQL when a database URL is configured, a journal when a
+    journal directory is, plain memory otherwise"""
+    # Each backend is imported only when it is picked, so workers without a
+    # database never load SQLAlchemy
+    if database_url:
+        from sql_storage import SQLStorage
+        return SQLStorage(app, database_url)
+    if journal_dir:
+        from journal import JournalStorage
+        return JournalStorage(journal_dir, commit_window, snapshot_every)
+    return MemoryStorage()
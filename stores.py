@@ -0,0 +1,98 @@
+"""Per-store partitions of the catalogue, sales history and their indexes.
+
+One process serves every store of a chain. Each store has its own
+inventory, search index, catalogue versions, sales ledger and aggregates,
+recent transactions, idempotency keys and locks, so a sale or an item edit
+in one store never waits on another store and never shows up in its
+reports or live screens. Item and transaction ids still come from the one
+storage backend and are unique across the chain; each record carries the
+id of the store it belongs to.
+
+Stores are configured with KASIR_STORES, a comma-separated list of store
+ids. The first one is the default store, served at the plain URLs
+(/cashier, /admin/dashboard, ...); every store, the default included, is
+also served under /stores/<store id>/. Records written before stores
+existed have no store id and belong to the default store.
+"""
+import os
+import re
+import threading
+
+from aggregates import SalesAggregates
+from catalogue import CatalogueLog
+from compaction import TransactionArchive
+from events import EventBroker
+from ledger import SalesLedger
+from locks import ItemLocks
+from recent import RecentTransactions
+from search_index import SearchIndex
+from timeline import TransactionTimeline
+
+DEFAULT_STORES = 'main'
+
+# Store ids appear in URLs, archive directory names and metric labels
+STORE_ID_PATTERN = re.compile(r'[a-z0-9][a-z0-9_-]{0,31}')
+
+
+def parse_store_ids(value):
+    """The store ids of a KASIR_STORES value, in order; raises ValueError for a bad one"""
+    store_ids = []
+    for store_id in (part.strip() for part in (value or DEFAULT_STORES).split(',')):
+        if not store_id:
+            continue
+        if not STORE_ID_PATTERN.fullmatch(store_id):
+            raise ValueError(f'Invalid store id {store_id!r}: use up to 32 lowercase letters, '
+                             f'digits, - and _')
+        if store_id not in store_ids:
+            store_ids.append(store_id)
+    if not store_ids:
+        raise ValueError('KASIR_STORES names no store')
+    return store_ids
+
+
+class Store:
+    """The in-memory state of one store"""
+
+    def __init__(self, store_id, archive_dir=None, event_queue=256, recent_capacity=1000):
+        self.id = store_id
+
+        # Catalogue
+        self.items = {}
+        self.items_by_code = {}  # kode -> item, kept in sync by add_item/update_item/remove_item
+        self.search_index = SearchIndex()
+        self.catalogue_log = CatalogueLog()  # item change versions for the POS catalogue sync
+        self.catalogue_snapshot = (None, None)  # (version, JSON body) of the last full catalogue served
+        self.published_stock = {}  # item id -> stock level last published to event streams
+        self.item_locks = ItemLocks()  # per-item locks taken by checkout and item edits
+        self.event_broker = EventBroker(event_queue)  # live updates for this store's /events
+
+        # Sales
+        self.transactions = TransactionTimeline()
+        self.sales_aggregates = SalesAggregates(top_n=10)
+        self.sales_ledger = SalesLedger()
+        self.recent_transactions = RecentTransactions(recent_capacity)
+        self.sale_keys = {}  # idempotency key of an offline sale -> transaction id, oldest first
+        self.sale_keys_lock = threading.Lock()
+        self.sale_batch_lock = threading.Lock()  # one offline batch at a time, so a key is never sold twice
+
+        # Transactions past the retention period, when archiving is enabled
+        self.archive = TransactionArchive(archive_dir) if archive_dir else None
+
+    def __repr__(self):
+        return f'Store({self.id!r})'
+
+
+def create_stores(store_ids, archive_dir=None, event_queue=256, recent_capacity=1000):
+    """{store id: Store} in configuration order
+
+    The default (first) store archives to `archive_dir` itself, where a
+    single-store installation already keeps its archive; every other store
+    to archive_dir/stores/<store id>.
+    """
+    stores = {}
+    for position, store_id in enumerate(store_ids):
+        store_archive = archive_dir
+        if archive_dir and position:
+            store_archive = os.path.join(archive_dir, 'stores', store_id)
+        stores[store_id] = Store(store_id, store_archive, event_queue, recent_capacity)
+    return stores
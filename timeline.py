@@ -0,0 +1,97 @@
+"""Transactions kept in time order for date-range queries.
+
+Every transaction is filed under a (datetime, id) key in a sorted list, so a
+range lookup is two bisections plus the matching transactions, O(log n + k),
+instead of a scan over the whole history. Sales arrive in time order, so
+adding one is an append; the occasional late arrival (e.g. synced from
+another worker) is inserted in place.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+
+def transaction_time(transaction):
+    """The transaction's 'YYYY-MM-DD HH:MM:SS' timestamp as a datetime"""
+    return datetime.fromisoformat(transaction['timestamp'])
+
+
+class TransactionTimeline:
+    """Thread-safe time-ordered sequence of transactions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []          # (datetime, id), ascending
+        self._transactions = []  # parallel to _keys
+
+    def __len__(self):
+        return len(self._transactions)
+
+    def __getitem__(self, index):
+        with self._lock:
+            return self._transactions[index]
+
+    def __iter__(self):
+        return self.iter_between()
+
+    def append(self, transaction):
+        """File a committed transaction under its timestamp"""
+        key = (transaction_time(transaction), transaction['id'])
+        with self._lock:
+            if not self._keys or key >= self._keys[-1]:
+                self._keys.append(key)
+                self._transactions.append(transaction)
+            else:
+                position = bisect_right(self._keys, key)
+                self._keys.insert(position, key)
+                self._transactions.insert(position, transaction)
+
+    def remove_before(self, cutoff):
+        """Take out and return every transaction before datetime `cutoff`, oldest first"""
+        with self._lock:
+            _, high = self._bounds(None, cutoff)
+            removed = self._transactions[:high]
+            del self._keys[:high]
+            del self._transactions[:high]
+            return removed
+
+    def between(self, start=None, end=None):
+        """Transactions with start <= timestamp < end, oldest first
+
+        Either bound may be None for an open range.
+        """
+        with self._lock:
+            low, high = self._bounds(start, end)
+            return self._transactions[low:high]
+
+    def count_between(self, start=None, end=None):
+        """Number of transactions in the range, in O(log n)"""
+        with self._lock:
+            low, high = self._bounds(start, end)
+            return max(high - low, 0)
+
+    def iter_between(self, start=None, end=None, chunk=1000):
+        """Like between(), but yields `chunk` transactions at a time
+
+        Each chunk is located afresh by bisection, so the lock is never held
+        while the caller works and memory stays bounded for any range size.
+        """
+        after = None
+        while True:
+            with self._lock:
+                low, high = self._bounds(start, end)
+                if after is not None:
+                    low = bisect_right(self._keys, after)
+                high = min(high, low + chunk)
+                batch = self._transactions[low:high]
+                if batch:
+                    after = self._keys[high - 1]
+            if not batch:
+                return
+            yield from batch
+
+    def _bounds(self, start, end):
+        # (datetime,) sorts before every (datetime, id) with the same datetime
+        low = 0 if start is None else bisect_left(self._keys, (start,))
+        high = len(self._keys) if end is None else bisect_left(self._keys, (end,))
+        return low, high